@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""Benchmark the parse, validate, render and cache hot paths of the translate scripts."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+from translate_common import (
+    TranslationCache,
+    TranslationKind,
+    atomic_write_text,
+    extract_json_object,
+    load_script,
+    save_cache,
+    validate_response,
+)
+
+
+TOP_LEVEL_ID_RE = re.compile(r"^(\s*id:\s*)(-?\d+)", re.MULTILINE)
+TEXT_FIELD_RE = re.compile(r"^(\s*(?:name|variety):\s*\")((?:\\.|[^\"\\])*)\"", re.MULTILINE)
+SOURCE_SCALES = (1, 5, 20)
+CACHE_SIZES = (10_000, 50_000, 200_000)
+RESPONSE_ROWS = (100, 2_000)
+CLIFF_RATIO = 2.0
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    name: str
+    units: int
+    setup: Callable[[], Callable[[], Any]]
+
+
+@dataclass(frozen=True)
+class Measurement:
+    name: str
+    units: int
+    best: float
+    median: float
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Time parsing, response validation, rendering and cache I/O on "
+        "synthetic inputs up to 20x the current sources, and compare with a baseline."
+    )
+    parser.add_argument(
+        "--source-dir",
+        type=Path,
+        default=Path("src"),
+        help="directory holding the English tiles.ts and items.ts",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=Path(".cache/translate-bench-baseline.json"),
+        help="stored timings to compare against (ignored when missing)",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="write this run's timings to --baseline",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="fail when a benchmark is this many times slower than its baseline "
+        "(default: 1.25)",
+    )
+    parser.add_argument(
+        "--filter",
+        action="append",
+        default=[],
+        help="run only benchmarks whose name contains this text; repeatable",
+    )
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    if args.threshold <= 1:
+        parser.error("--threshold must be greater than 1")
+    return args
+
+
+def scale_source(source: str, factor: int) -> str:
+    start = source.index("[\n", source.index("export const")) + 2
+    end = source.rindex("\n];")
+    body = source[start:end]
+    id_span = max(int(value) for _, value in TOP_LEVEL_ID_RE.findall(body)) + 1
+    copies = [body]
+    for copy in range(1, factor):
+        shifted = TOP_LEVEL_ID_RE.sub(
+            lambda match: f"{match.group(1)}{int(match.group(2)) + id_span * copy}", body
+        )
+        copies.append(
+            TEXT_FIELD_RE.sub(lambda match: f'{match.group(1)}{match.group(2)} {copy}"', shifted)
+        )
+    return source[:start] + ",\n".join(copies) + source[end:]
+
+
+def stand_in_translations(keys: list[str]) -> dict[str, str]:
+    return {key: f"译{index}" for index, key in enumerate(keys)}
+
+
+def response_content(rows: int, malformed: bool) -> str:
+    content = json.dumps(
+        {"translations": [{"id": row, "text": f"译文{row}"} for row in range(rows)]},
+        ensure_ascii=False,
+    )
+    if malformed:
+        return f"Here are the translations:\n```json\n{content}\n```\nLet me know."
+    return content
+
+
+def benchmarks(args: argparse.Namespace, directory: Path) -> list[Benchmark]:
+    tiles = load_script("translate-tiles")
+    items = load_script("translate-items")
+    tiles_source = (args.source_dir / "tiles.ts").read_text(encoding="utf-8")
+    items_source = (args.source_dir / "items.ts").read_text(encoding="utf-8")
+    suite: list[Benchmark] = []
+
+    for scale in SOURCE_SCALES:
+        scaled_tiles = scale_source(tiles_source, scale)
+        scaled_items = scale_source(items_source, scale)
+        tile_fields = len(tiles.parse_fields(scaled_tiles))
+        item_count = len(items.parse_items(scaled_items))
+        suite.append(
+            Benchmark(
+                f"parse_fields x{scale}",
+                tile_fields,
+                lambda source=scaled_tiles: lambda: tiles.parse_fields(source),
+            )
+        )
+        suite.append(
+            Benchmark(
+                f"parse_items x{scale}",
+                item_count,
+                lambda source=scaled_items: lambda: items.parse_items(source),
+            )
+        )
+
+        def render_tiles(source: str = scaled_tiles) -> Callable[[], Any]:
+            fields = tiles.parse_fields(source)
+            translations = stand_in_translations(fields.keys)
+
+            def run() -> None:
+                output = tiles.render_output(source, fields, translations)
+                tiles.verify_output(source, fields, output)
+
+            return run
+
+        def render_items(source: str = scaled_items) -> Callable[[], Any]:
+            parsed = items.parse_items(source)
+            translations = stand_in_translations([item.source_name for item in parsed])
+
+            def run() -> None:
+                items.verify_output(parsed, items.render_output(source, parsed, translations))
+
+            return run
+
+        suite.append(Benchmark(f"render+verify tiles x{scale}", tile_fields, render_tiles))
+        suite.append(Benchmark(f"render+verify items x{scale}", item_count, render_items))
+
+    for rows in RESPONSE_ROWS:
+        batch = [(f"name\0Text {row}", "name", f"Text {row}") for row in range(rows)]
+        for malformed in (False, True):
+            content = response_content(rows, malformed)
+            label = "malformed" if malformed else "clean"
+            suite.append(
+                Benchmark(
+                    f"extract+validate {label} {rows} rows",
+                    rows,
+                    lambda content=content, batch=batch: lambda: validate_response(
+                        tiles.KIND, extract_json_object(content), batch
+                    ),
+                )
+            )
+        invalid = response_content(rows, False).replace(f'"id": {rows - 1}', '"id": -1')
+        suite.append(
+            Benchmark(
+                f"validate rejects {rows} rows",
+                rows,
+                lambda content=invalid, batch=batch: lambda: reject(
+                    tiles.KIND, content, batch
+                ),
+            )
+        )
+
+    for size in CACHE_SIZES:
+        cache = TranslationCache(prompt=tiles.PROMPT_VERSION)
+        for index in range(size):
+            cache.record(f"name\0Synthetic Tile {index}", f"合成方块{index}", "bench", [])
+        path = directory / f"cache-{size}.json"
+        save_cache(path, cache)
+        suite.append(
+            Benchmark(
+                f"save_cache {size}",
+                size,
+                lambda cache=cache, path=path: lambda: save_cache(path, cache),
+            )
+        )
+        suite.append(
+            Benchmark(
+                f"load_cache {size}", size, lambda path=path: lambda: tiles.load_cache(path)
+            )
+        )
+    return [
+        benchmark
+        for benchmark in suite
+        if not args.filter or any(text in benchmark.name for text in args.filter)
+    ]
+
+
+def reject(kind: TranslationKind, content: str, batch: list[tuple[str, str, str]]) -> None:
+    try:
+        validate_response(kind, extract_json_object(content), batch)
+    except ValueError:
+        return
+    raise AssertionError("invalid response was accepted")
+
+
+def measure(benchmark: Benchmark, repeat: int) -> Measurement:
+    run = benchmark.setup()
+    run()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return Measurement(benchmark.name, benchmark.units, min(timings), statistics.median(timings))
+
+
+def load_baseline(path: Path) -> dict[str, float]:
+    if not path.exists():
+        return {}
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if data.get("version") != 1 or not isinstance(data.get("results"), dict):
+        raise ValueError(f"unsupported benchmark baseline format: {path}")
+    return data["results"]
+
+
+def scaling_cliffs(measurements: list[Measurement]) -> list[str]:
+    families: dict[str, list[Measurement]] = {}
+    for measurement in measurements:
+        family = re.sub(r" (?:x\d+|\d+ rows|\d+)$", "", measurement.name)
+        families.setdefault(family, []).append(measurement)
+    cliffs = []
+    for family, members in families.items():
+        if len(members) < 2:
+            continue
+        members.sort(key=lambda measurement: measurement.units)
+        smallest, largest = members[0], members[-1]
+        ratio = (largest.best / largest.units) / (smallest.best / smallest.units)
+        if ratio > CLIFF_RATIO:
+            cliffs.append(
+                f"{family}: per-unit time grows {ratio:.1f}x from {smallest.units} to "
+                f"{largest.units} units"
+            )
+    return cliffs
+
+
+def main() -> int:
+    args = parse_args()
+    baseline = load_baseline(args.baseline)
+    measurements: list[Measurement] = []
+    regressions = 0
+    print(
+        f"{'benchmark':36} {'units':>8} {'best ms':>9} {'median ms':>10} "
+        f"{'us/unit':>8}  baseline"
+    )
+    directory = Path(tempfile.mkdtemp(prefix="translate-bench-"))
+    try:
+        for benchmark in benchmarks(args, directory):
+            measurement = measure(benchmark, args.repeat)
+            measurements.append(measurement)
+            previous = baseline.get(measurement.name)
+            comparison = ""
+            if previous:
+                ratio = measurement.best / previous
+                comparison = f"{ratio:.2f}x"
+                if ratio > args.threshold:
+                    regressions += 1
+                    comparison += " REGRESSION"
+            print(
+                f"{measurement.name:36} {measurement.units:>8} "
+                f"{measurement.best * 1000:>9.2f} {measurement.median * 1000:>10.2f} "
+                f"{measurement.best / measurement.units * 1e6:>8.2f}  {comparison}",
+                flush=True,
+            )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    for cliff in scaling_cliffs(measurements):
+        print(f"Scaling cliff: {cliff}")
+    if args.save_baseline:
+        data = {
+            "version": 1,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": {
+                **baseline,
+                **{measurement.name: measurement.best for measurement in measurements},
+            },
+        }
+        atomic_write_text(args.baseline, json.dumps(data, indent=2, sort_keys=True) + "\n")
+        print(f"Saved baseline to {args.baseline}")
+    if regressions and not args.save_baseline:
+        print(f"{regressions} benchmarks are more than {args.threshold:g}x slower than baseline")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except (OSError, ValueError, ImportError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        raise SystemExit(1)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Build a precomputed prefix search index from translated tiles, items and walls.
+
+Pinyin and initials keys for Chinese locales need the pypinyin package
+(pip install pypinyin); pass --no-pinyin to build without them.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sys
+import unicodedata
+from pathlib import Path
+from typing import Any
+
+from translate_common import atomic_write_text, load_source_entries
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+
+NORMALIZE_DROP_RE = re.compile(r"[\W_]+")
+TOKEN_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]|[^\W_\u3400-\u9fff\uf900-\ufaff]+")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Precompute normalized, pinyin and initials prefix tables for "
+        "translated tile, item and wall names."
+    )
+    parser.add_argument(
+        "--locale",
+        action="append",
+        help="locale to index; repeat for several (default: zh-CN)",
+    )
+    parser.add_argument(
+        "--source-dir",
+        type=Path,
+        default=Path("src"),
+        help="directory holding tiles.<locale>.ts, items.<locale>.ts and walls.<locale>.ts",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=Path("public"),
+        help="directory for search-index.<locale>.json, served for lazy loading "
+        "(default: public)",
+    )
+    parser.add_argument(
+        "--no-pinyin",
+        action="store_true",
+        help="skip pinyin and initials keys even for Chinese locales; they need the "
+        "pypinyin package",
+    )
+    args = parser.parse_args()
+    args.locale = args.locale or ["zh-CN"]
+    if (
+        not args.no_pinyin
+        and lazy_pinyin is None
+        and any(locale.startswith("zh") for locale in args.locale)
+    ):
+        parser.error("pinyin keys need the pypinyin package; install it or pass --no-pinyin")
+    return args
+
+
+def tile_labels(tiles: list[dict[str, Any]]) -> list[tuple[str, int, int | None, str]]:
+    labels: list[tuple[str, int, int | None, str]] = []
+    for tile in tiles:
+        labels.append(("tile", tile["id"], None, tile["name"]))
+        for frame_index, frame in enumerate(tile.get("frames", [])):
+            if frame.get("name") == "Default" and frame.get("variety") == "Default":
+                continue
+            text = tile["name"]
+            if frame.get("name") and frame["name"] != tile["name"]:
+                text += f" - {frame['name']}"
+            if frame.get("variety") and frame["variety"] != "Default":
+                text += f" - {frame['variety']}"
+            if text == tile["name"] and frame.get("u", 0) == 0 and frame.get("v", 0) == 0:
+                continue
+            labels.append(("tile", tile["id"], frame_index, text))
+    return labels
+
+
+def normalize(text: str) -> str:
+    return NORMALIZE_DROP_RE.sub("", unicodedata.normalize("NFKC", text).casefold())
+
+
+def pinyin_syllables(text: str, style: Any) -> list[str]:
+    return [
+        syllable
+        for syllable in (normalize(chunk) for chunk in lazy_pinyin(text, style=style))
+        if syllable
+    ]
+
+
+def search_keys(label: str, use_pinyin: bool) -> set[str]:
+    token_lists = [TOKEN_RE.findall(normalize(label))]
+    if use_pinyin:
+        token_lists.extend(
+            pinyin_syllables(label, style) for style in (Style.NORMAL, Style.FIRST_LETTER)
+        )
+    return {
+        "".join(tokens[start:]) for tokens in token_lists for start in range(len(tokens))
+    }
+
+
+def build_index(locale: str, source_dir: Path, use_pinyin: bool) -> dict[str, Any]:
+    labels = tile_labels(load_source_entries(source_dir / f"tiles.{locale}.ts"))
+    labels.extend(
+        ("item", item["id"], None, item["name"])
+        for item in load_source_entries(source_dir / f"items.{locale}.ts")
+    )
+    labels.extend(
+        ("wall", wall["id"], None, wall["name"])
+        for wall in load_source_entries(source_dir / f"walls.{locale}.ts")
+    )
+
+    refs_by_key: dict[str, list[int]] = {}
+    for entry_index, (_, _, _, label) in enumerate(labels):
+        for key in search_keys(label, use_pinyin):
+            refs_by_key.setdefault(key, []).append(entry_index)
+    prefixes = sorted(refs_by_key.items())
+    return {
+        "version": 1,
+        "locale": locale,
+        "pinyin": use_pinyin,
+        "entries": [list(entry) for entry in labels],
+        "prefixes": [[key, refs] for key, refs in prefixes],
+    }
+
+
+def main() -> int:
+    args = parse_args()
+    for locale in args.locale:
+        use_pinyin = locale.startswith("zh") and not args.no_pinyin
+        index = build_index(locale, args.source_dir, use_pinyin)
+        output = args.output_dir / f"search-index.{locale}.json"
+        atomic_write_text(
+            output,
+            json.dumps(index, ensure_ascii=False, separators=(",", ":")) + "\n",
+        )
+        print(
+            f"Wrote {len(index['entries'])} entries and {len(index['prefixes'])} "
+            f"prefix keys to {output}"
+            + ("" if use_pinyin else " (no pinyin keys)")
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        raise SystemExit(1)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Build per-world name bundles holding only the tiles, frames and walls a world uses."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+from translate_common import atomic_write_text, load_script, load_source_entries
+
+
+FRAME_FIELDS = ("u", "v", "name", "variety")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Scan .wld files and write, for each world and locale, a bundle of "
+        "translated names for just the tiles, frames and walls that occur in it."
+    )
+    parser.add_argument(
+        "worlds",
+        nargs="*",
+        type=Path,
+        help="world files to scan (default: Worlds/*.wld)",
+    )
+    parser.add_argument(
+        "--locale",
+        action="append",
+        help="target locale; repeat for several (default: zh-CN)",
+    )
+    parser.add_argument(
+        "--source-dir",
+        type=Path,
+        default=Path("src"),
+        help="directory holding the English tiles.ts and walls.ts",
+    )
+    parser.add_argument("--cache-dir", type=Path, default=Path(".cache"))
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=Path("public/worlds"),
+        help="directory for <world>.<locale>.json, served for first paint "
+        "(default: public/worlds)",
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="fail when a needed name has no cached translation instead of keeping "
+        "its English text",
+    )
+    args = parser.parse_args()
+    args.locale = args.locale or ["zh-CN"]
+    args.worlds = args.worlds or sorted(Path("Worlds").glob("*.wld"))
+    if not args.worlds:
+        parser.error("no world files given and none found under Worlds/")
+    return args
+
+
+def matching_frames(
+    frames: list[dict[str, Any]], coordinates: list[tuple[int, int]]
+) -> list[int]:
+    matched: set[int] = set()
+    for u, v in coordinates:
+        match = None
+        for index, frame in enumerate(frames):
+            if frame.get("u", 0) <= u and frame.get("v", 0) <= v:
+                match = index
+        if match is not None:
+            matched.add(match)
+    return sorted(matched)
+
+
+class Bundler:
+    def __init__(
+        self,
+        tiles: dict[int, dict[str, Any]],
+        walls: dict[int, dict[str, Any]],
+        tile_cache: dict[str, str],
+        wall_cache: dict[str, str],
+    ) -> None:
+        self.tiles = tiles
+        self.walls = walls
+        self.tile_cache = tile_cache
+        self.wall_cache = wall_cache
+        self.missing: set[str] = set()
+
+    def translate(self, cache: dict[str, str], key: str, text: str) -> str:
+        translated = cache.get(key)
+        if translated is None:
+            self.missing.add(key)
+            return text
+        return translated
+
+    def tile_text(self, field: str, text: str) -> str:
+        return self.translate(self.tile_cache, f"{field}\0{text}", text)
+
+    def build(self, world: str, locale: str, histogram: Any) -> dict[str, Any]:
+        coordinates: dict[int, list[tuple[int, int]]] = defaultdict(list)
+        for tile_id, u, v in histogram.frames:
+            coordinates[tile_id].append((u, v))
+
+        tiles = []
+        for tile_id in sorted(histogram.tiles):
+            tile = self.tiles.get(tile_id)
+            if tile is None:
+                continue
+            entry: dict[str, Any] = {
+                "id": tile_id,
+                "name": self.tile_text("name", tile["name"]),
+            }
+            frames = tile.get("frames", [])
+            bundled_frames = []
+            for index in matching_frames(frames, coordinates[tile_id]):
+                frame = {
+                    key: frames[index][key] for key in FRAME_FIELDS if key in frames[index]
+                }
+                for field in ("name", "variety"):
+                    if field in frame:
+                        frame[field] = self.tile_text(field, frame[field])
+                bundled_frames.append(frame)
+            if bundled_frames:
+                entry["frames"] = bundled_frames
+            tiles.append(entry)
+
+        walls = []
+        for wall_id in sorted(histogram.walls):
+            wall = self.walls.get(wall_id)
+            if wall is not None:
+                name = self.translate(self.wall_cache, wall["name"], wall["name"])
+                walls.append({"id": wall_id, "name": name})
+        return {
+            "version": 1,
+            "world": world,
+            "locale": locale,
+            "tiles": tiles,
+            "walls": walls,
+        }
+
+
+def main() -> int:
+    args = parse_args()
+    world_histogram = load_script("world-histogram")
+    translate_tiles = load_script("translate-tiles")
+    translate_walls = load_script("translate-walls")
+    tiles = {
+        entry["id"]: entry for entry in load_source_entries(args.source_dir / "tiles.ts")
+    }
+    walls = {
+        entry["id"]: entry for entry in load_source_entries(args.source_dir / "walls.ts")
+    }
+
+    histograms = []
+    for path in args.worlds:
+        histogram = world_histogram.Histogram()
+        world_histogram.read_world(path, histogram)
+        histograms.append((path.stem, histogram))
+        print(
+            f"Scanned {path}: {len(histogram.tiles)} tile IDs, {len(histogram.frames)} "
+            f"frames, {len(histogram.walls)} wall IDs"
+        )
+
+    incomplete = 0
+    for locale in args.locale:
+        bundler = Bundler(
+            tiles,
+            walls,
+            translate_tiles.load_cache(args.cache_dir / f"tiles-{locale}.json"),
+            translate_walls.load_cache(args.cache_dir / f"walls-{locale}.json"),
+        )
+        for world, histogram in histograms:
+            bundler.missing.clear()
+            bundle = bundler.build(world, locale, histogram)
+            if bundler.missing:
+                incomplete += 1
+                if args.strict:
+                    print(
+                        f"{world} {locale}: {len(bundler.missing)} names have no cached "
+                        "translation; skipped"
+                    )
+                    continue
+            output_path = args.output_dir / f"{world}.{locale}.json"
+            atomic_write_text(
+                output_path,
+                json.dumps(bundle, ensure_ascii=False, separators=(",", ":")) + "\n",
+            )
+            frames = sum(len(tile.get("frames", [])) for tile in bundle["tiles"])
+            print(
+                f"Wrote {len(bundle['tiles'])} tiles, {frames} frames and "
+                f"{len(bundle['walls'])} walls to {output_path}"
+                + (
+                    f" ({len(bundler.missing)} names kept in English)"
+                    if bundler.missing
+                    else ""
+                )
+            )
+    if incomplete and args.strict:
+        print("Run the translate scripts to fill the caches, then build again")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except (OSError, ValueError, ImportError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        raise SystemExit(1)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""Kill the translate scripts at random points and check the cache and output survive."""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+from translate_common import SCRIPTS_DIR, load_script
+
+
+KINDS = ("tiles", "items", "walls")
+PARSERS = {"tiles": "parse_fields", "items": "parse_items", "walls": "parse_walls"}
+
+
+@dataclass(frozen=True)
+class Trial:
+    kind: str
+    kill_after: float
+    killed: bool
+    cached: int
+    delivered: int
+    lost: int
+    leftover_temp_files: int
+    recovery_seconds: float
+
+
+class StandInApi:
+    def __init__(self, latency: float, stall_rate: float, seed: int) -> None:
+        self.latency = latency
+        self.stall_rate = stall_rate
+        self.random = random.Random(seed)
+        self.delivered: set[str] = set()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def api_base(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def reset(self) -> None:
+        with self.lock:
+            self.delivered = set()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                raw = self.rfile.read(int(self.headers["Content-Length"]))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    raw = gzip.decompress(raw)
+                body = json.loads(raw)
+                payload = json.loads(body["messages"][-1]["content"])
+                with api.lock:
+                    stall = api.random.random() < api.stall_rate
+                delay = api.latency * (20 if stall else 1)
+
+                rows = []
+                texts = []
+                for group, value in payload.items():
+                    if group == "hints":
+                        continue
+                    field = "name" if group in ("items", "walls") else "text"
+                    for row_id, text in value:
+                        texts.append(text)
+                        rows.append({"id": row_id, field: stand_in_translation(text)})
+                if body.get("stream"):
+                    self.stream_rows(rows, texts, delay)
+                    return
+                time.sleep(delay)
+                content = json.dumps({"translations": rows}, ensure_ascii=False)
+                data = json.dumps(
+                    {"choices": [{"message": {"content": content}}]}, ensure_ascii=False
+                ).encode("utf-8")
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                with api.lock:
+                    api.delivered.update(texts)
+
+            def stream_rows(
+                self, rows: list[dict[str, Any]], texts: list[str], delay: float
+            ) -> None:
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    pieces = ['{"translations":[']
+                    pieces.extend(
+                        ("," if index else "") + json.dumps(row, ensure_ascii=False)
+                        for index, row in enumerate(rows)
+                    )
+                    pieces.append("]}")
+                    for index, piece in enumerate(pieces):
+                        time.sleep(delay / len(pieces))
+                        chunk = {"choices": [{"delta": {"content": piece}}]}
+                        self.wfile.write(
+                            f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+                        )
+                        self.wfile.flush()
+                        if 0 < index <= len(texts):
+                            with api.lock:
+                                api.delivered.add(texts[index - 1])
+                    self.wfile.write(b"data: [DONE]\n\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+
+        return Handler
+
+
+def stand_in_translation(text: str) -> str:
+    digest = hashlib.sha1(text.encode("utf-8")).digest()
+    return "".join(chr(0x4E00 + byte * 41 % 20000) for byte in digest[:4])
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Run the translate scripts against a local stand-in API, SIGKILL "
+        "them at randomized points, and measure durability and recovery."
+    )
+    parser.add_argument("--kind", choices=KINDS, action="append")
+    parser.add_argument(
+        "--input-dir",
+        type=Path,
+        default=Path("src"),
+        help="directory holding the English tiles.ts, items.ts and walls.ts",
+    )
+    parser.add_argument("--trials", type=int, default=10)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="seconds the stand-in API takes per batch (default: 0.05)",
+    )
+    parser.add_argument(
+        "--stall-rate",
+        type=float,
+        default=0.1,
+        help="fraction of batches that take 20x longer, to kill during stuck waits",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--script-arg",
+        action="append",
+        default=[],
+        help="extra argument passed to every translate script run; repeatable",
+    )
+    args = parser.parse_args()
+    args.kind = args.kind or list(KINDS)
+    if args.trials < 1:
+        parser.error("--trials must be at least 1")
+    if args.latency < 0 or not 0 <= args.stall_rate <= 1:
+        parser.error("--latency must be non-negative and --stall-rate within 0..1")
+    return args
+
+
+def script_command(
+    kind: str, args: argparse.Namespace, api: StandInApi, workdir: Path
+) -> list[str]:
+    return [
+        sys.executable,
+        str(SCRIPTS_DIR / f"translate-{kind}.py"),
+        "--input",
+        str(args.input_dir / f"{kind}.ts"),
+        "--output",
+        str(workdir / f"{kind}.zh-CN.ts"),
+        "--cache",
+        str(workdir / f"{kind}-zh-CN.json"),
+        "--api-base",
+        api.api_base,
+        "--model",
+        "stand-in",
+        *args.script_arg,
+    ]
+
+
+def run_to_completion(command: list[str], environment: dict[str, str]) -> float:
+    started = time.perf_counter()
+    result = subprocess.run(command, env=environment, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"recovery run failed:\n{result.stderr}")
+    return time.perf_counter() - started
+
+
+def check_output(module: ModuleType, kind: str, source: str, output_path: Path) -> None:
+    if not output_path.exists():
+        return
+    output = output_path.read_text(encoding="utf-8")
+    parse = getattr(module, PARSERS[kind])
+    if len(parse(output)) != len(parse(source)):
+        raise AssertionError(f"{output_path} is partial")
+
+
+def run_trial(
+    kind: str,
+    module: ModuleType,
+    args: argparse.Namespace,
+    api: StandInApi,
+    environment: dict[str, str],
+    full_runtime: float,
+    rng: random.Random,
+) -> Trial:
+    source = (args.input_dir / f"{kind}.ts").read_text(encoding="utf-8")
+    workdir = Path(tempfile.mkdtemp(prefix=f"crash-{kind}-"))
+    try:
+        command = script_command(kind, args, api, workdir)
+        cache_path = workdir / f"{kind}-zh-CN.json"
+        api.reset()
+        kill_after = rng.uniform(0, full_runtime)
+        process = subprocess.Popen(
+            command, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            process.wait(timeout=kill_after)
+            killed = False
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            killed = True
+
+        translations = module.load_cache(cache_path)
+        check_output(module, kind, source, workdir / f"{kind}.zh-CN.ts")
+        cached_sources = {key.split("\0", 1)[-1] for key in translations}
+        delivered = set(api.delivered)
+        leftovers = len(list(workdir.glob(".*.tmp")))
+
+        recovery_seconds = run_to_completion(command, environment)
+        module.load_cache(cache_path)
+        check_output(module, kind, source, workdir / f"{kind}.zh-CN.ts")
+        if not (workdir / f"{kind}.zh-CN.ts").exists():
+            raise AssertionError(f"recovery run did not write {kind}.zh-CN.ts")
+        return Trial(
+            kind=kind,
+            kill_after=kill_after,
+            killed=killed,
+            cached=len(translations),
+            delivered=len(delivered),
+            lost=len(delivered - cached_sources),
+            leftover_temp_files=leftovers,
+            recovery_seconds=recovery_seconds,
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main() -> int:
+    args = parse_args()
+    rng = random.Random(args.seed)
+    environment = {**os.environ, "OPENAI_API_KEY": "stand-in"}
+    api = StandInApi(args.latency, args.stall_rate, args.seed)
+    failures = 0
+    try:
+        for kind in args.kind:
+            module = load_script(f"translate-{kind}")
+            workdir = Path(tempfile.mkdtemp(prefix=f"crash-{kind}-"))
+            try:
+                full_runtime = run_to_completion(
+                    script_command(kind, args, api, workdir), environment
+                )
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            print(f"{kind}: uninterrupted run takes {full_runtime:.2f}s")
+
+            trials: list[Trial] = []
+            for number in range(1, args.trials + 1):
+                try:
+                    trial = run_trial(
+                        kind, module, args, api, environment, full_runtime, rng
+                    )
+                except (AssertionError, ValueError, RuntimeError, json.JSONDecodeError) as error:
+                    failures += 1
+                    print(f"  trial {number}: FAILED: {error}")
+                    continue
+                trials.append(trial)
+                print(
+                    f"  trial {number}: {'killed' if trial.killed else 'finished'} "
+                    f"at {trial.kill_after:.2f}s, cached {trial.cached}, "
+                    f"lost {trial.lost}/{trial.delivered} delivered, "
+                    f"{trial.leftover_temp_files} temp files, "
+                    f"recovered in {trial.recovery_seconds:.2f}s"
+                )
+            if trials:
+                print(
+                    f"{kind}: mean lost {sum(t.lost for t in trials) / len(trials):.1f}, "
+                    f"max lost {max(t.lost for t in trials)}, "
+                    f"mean recovery {sum(t.recovery_seconds for t in trials) / len(trials):.2f}s"
+                )
+    finally:
+        api.close()
+    if failures:
+        print(f"{failures} trials left an unloadable cache or a partial output")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except (OSError, ImportError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        raise SystemExit(1)
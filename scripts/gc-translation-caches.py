@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Move cached translations that no current source uses into each cache's cold archive."""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from types import ModuleType
+
+from translate_common import (
+    DEFAULT_ARCHIVE_MAX_AGE_DAYS,
+    DEFAULT_ARCHIVE_MAX_ENTRIES,
+    archive_path,
+    collect_garbage,
+    evict_archive,
+    load_archive,
+    load_script,
+    save_archive,
+)
+
+
+KINDS = ("tiles", "items", "walls")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Archive cache keys no longer referenced by tiles.ts, items.ts or "
+        "walls.ts, and evict archived entries beyond the age and size bounds."
+    )
+    parser.add_argument("--kind", choices=KINDS, action="append")
+    parser.add_argument(
+        "--source-dir",
+        type=Path,
+        default=Path("src"),
+        help="directory holding the English tiles.ts, items.ts and walls.ts",
+    )
+    parser.add_argument("--cache-dir", type=Path, default=Path(".cache"))
+    parser.add_argument(
+        "--max-age-days",
+        type=float,
+        help="evict archived translations older than this (default: the translate "
+        "scripts' --archive-max-age-days default)",
+    )
+    parser.add_argument(
+        "--max-entries",
+        type=int,
+        help="evict the oldest archived translations beyond this many per cache "
+        "(default: the translate scripts' --archive-max-entries default)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="report live, stale and archived counts without changing any file",
+    )
+    args = parser.parse_args()
+    args.kind = args.kind or list(KINDS)
+    if (args.max_age_days is not None and args.max_age_days < 0) or (
+        args.max_entries is not None and args.max_entries < 0
+    ):
+        parser.error("--max-age-days and --max-entries must not be negative")
+    return args
+
+
+def live_keys(module: ModuleType, kind: str, source: str) -> set[str]:
+    if kind == "tiles":
+        return set(module.parse_fields(source).keys)
+    if kind == "items":
+        return {item.source_name for item in module.parse_items(source)}
+    return {wall.source_name for wall in module.parse_walls(source)}
+
+
+def collect(kind: str, args: argparse.Namespace) -> None:
+    module = load_script(f"translate-{kind}")
+    cache_path = args.cache_dir / f"{kind}-zh-CN.json"
+    archive = archive_path(cache_path)
+    max_age_days = (
+        DEFAULT_ARCHIVE_MAX_AGE_DAYS if args.max_age_days is None else args.max_age_days
+    )
+    max_entries = (
+        DEFAULT_ARCHIVE_MAX_ENTRIES if args.max_entries is None else args.max_entries
+    )
+    source = (args.source_dir / f"{kind}.ts").read_text(encoding="utf-8")
+    live = live_keys(module, kind, source)
+    translations = module.load_cache(cache_path)
+    stale = sum(key not in live for key in translations)
+    if args.dry_run:
+        archived = len(load_archive(archive))
+        print(
+            f"{kind}: {len(translations) - stale} live and {stale} stale cached "
+            f"translations, {archived} archived in {archive}"
+        )
+        return
+
+    archived, evicted = collect_garbage(
+        cache_path, translations, live, max_age_days, max_entries
+    )
+    if not archived:
+        entries = load_archive(archive)
+        evicted = evict_archive(entries, max_age_days, max_entries, time.time())
+        if evicted:
+            save_archive(archive, entries)
+    print(
+        f"{kind}: kept {len(translations)} live translations in {cache_path}, "
+        f"archived {archived} and evicted {evicted} from {archive}"
+    )
+
+
+def main() -> int:
+    args = parse_args()
+    for kind in args.kind:
+        collect(kind, args)
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except (OSError, ValueError, ImportError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        raise SystemExit(1)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""Drop selected cached translations so the next translate run redoes only those."""
+
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+from translate_common import load_script, save_cache
+
+
+KINDS = ("tiles", "items", "walls")
+
+
+class CacheIndex:
+    def __init__(self, kind: str, translations: Any) -> None:
+        self.by_model: dict[str | None, set[str]] = defaultdict(set)
+        self.by_prompt: dict[str | None, set[str]] = defaultdict(set)
+        self.by_field: dict[str, set[str]] = defaultdict(set)
+        self.by_flag: dict[str, set[str]] = defaultdict(set)
+        for key in translations:
+            entry = translations.metadata.get(key, {})
+            self.by_model[entry.get("model")].add(key)
+            self.by_prompt[entry.get("prompt")].add(key)
+            for flag in entry.get("flags", []):
+                self.by_flag[flag].add(key)
+            if kind == "tiles":
+                self.by_field[key.split("\0", 1)[0]].add(key)
+
+    @staticmethod
+    def union(index: dict[Any, set[str]], values: list[Any]) -> set[str]:
+        selected: set[str] = set()
+        for value in values:
+            selected |= index.get(value, set())
+        return selected
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Remove cached translations matching every given selector from "
+        "the tile, item and wall caches; the next translate run retranslates them."
+    )
+    parser.add_argument("--kind", choices=KINDS, action="append")
+    parser.add_argument("--cache-dir", type=Path, default=Path(".cache"))
+    parser.add_argument(
+        "--model",
+        action="append",
+        default=[],
+        help="select entries translated by this model; repeat for several, or pass "
+        "'none' for imported and composed entries and entries cached before models "
+        "were recorded",
+    )
+    parser.add_argument(
+        "--prompt",
+        action="append",
+        default=[],
+        metavar="VERSION",
+        help="select entries translated with this system prompt version; repeatable",
+    )
+    parser.add_argument(
+        "--stale-prompt",
+        action="store_true",
+        help="select model translations made with a different system prompt; imported "
+        "and composed entries have no prompt and are left alone",
+    )
+    parser.add_argument(
+        "--field",
+        choices=("name", "variety"),
+        action="append",
+        default=[],
+        help="select tile entries of this field",
+    )
+    parser.add_argument(
+        "--flag",
+        action="append",
+        default=[],
+        help="select entries carrying this validation flag, such as 'unchanged', "
+        "'Latin letters remain', 'imported' or 'composed'; repeatable",
+    )
+    parser.add_argument("--source", type=re.compile, help="regex on the English text")
+    parser.add_argument("--target", type=re.compile, help="regex on the translation")
+    parser.add_argument(
+        "--older-than",
+        type=float,
+        metavar="DAYS",
+        help="select entries translated more than this many days ago, or at an "
+        "unrecorded time",
+    )
+    parser.add_argument(
+        "--show",
+        type=int,
+        default=10,
+        help="print this many selected entries per cache (default: 10)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="report the selection without changing any cache",
+    )
+    args = parser.parse_args()
+    args.kind = args.kind or list(KINDS)
+    if not any(
+        (
+            args.model,
+            args.prompt,
+            args.stale_prompt,
+            args.field,
+            args.flag,
+            args.source,
+            args.target,
+            args.older_than is not None,
+        )
+    ):
+        parser.error("give at least one selector; use --model, --prompt, --field, ...")
+    if args.field and args.kind != ["tiles"]:
+        parser.error("--field only applies to --kind tiles")
+    if args.older_than is not None and args.older_than < 0:
+        parser.error("--older-than must not be negative")
+    if args.show < 0:
+        parser.error("--show must not be negative")
+    args.model = [None if model == "none" else model for model in args.model]
+    return args
+
+
+def select(
+    args: argparse.Namespace, module: ModuleType, kind: str, translations: Any
+) -> list[str]:
+    index = CacheIndex(kind, translations)
+    selected = set(translations)
+    if args.model:
+        selected &= index.union(index.by_model, args.model)
+    if args.prompt:
+        selected &= index.union(index.by_prompt, args.prompt)
+    if args.stale_prompt:
+        selected -= index.by_prompt.get(module.PROMPT_VERSION, set())
+        selected -= index.by_prompt.get(None, set())
+    if args.field:
+        selected &= index.union(index.by_field, args.field)
+    if args.flag:
+        selected &= index.union(index.by_flag, args.flag)
+
+    cutoff = None if args.older_than is None else time.time() - args.older_than * 86400
+    matches = []
+    for key in selected:
+        source_text = module.KIND.split_key(key)[1]
+        if args.source is not None and not args.source.search(source_text):
+            continue
+        if args.target is not None and not args.target.search(translations[key]):
+            continue
+        translated_at = translations.metadata.get(key, {}).get("translated_at")
+        if cutoff is not None and isinstance(translated_at, (int, float)):
+            if translated_at >= cutoff:
+                continue
+        matches.append(key)
+    return sorted(matches)
+
+
+def invalidate(kind: str, args: argparse.Namespace) -> None:
+    module = load_script(f"translate-{kind}")
+    cache_path = args.cache_dir / f"{kind}-zh-CN.json"
+    translations = module.load_cache(cache_path)
+    keys = select(args, module, kind, translations)
+    for key in keys[: args.show]:
+        entry = translations.metadata.get(key, {})
+        print(
+            f"  {key.replace(chr(0), ': ')} -> {translations[key]} "
+            f"(model {entry.get('model')}, prompt {entry.get('prompt')})"
+        )
+    if args.dry_run:
+        print(f"{kind}: would invalidate {len(keys)}/{len(translations)} in {cache_path}")
+        return
+    for key in keys:
+        del translations[key]
+    if keys:
+        save_cache(cache_path, translations)
+    print(f"{kind}: invalidated {len(keys)} cached translations in {cache_path}")
+
+
+def main() -> int:
+    args = parse_args()
+    for kind in args.kind:
+        invalidate(kind, args)
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except (OSError, ValueError, ImportError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        raise SystemExit(1)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Parse, render and verify every translated source file in parallel worker processes."""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+
+from translate_common import atomic_write_text, load_script
+
+
+KINDS = ("tiles", "items", "walls")
+
+
+@dataclass(frozen=True)
+class Job:
+    kind: str
+    locale: str
+    source_path: Path
+    cache_path: Path
+    output_path: Path
+    check_only: bool
+
+
+@dataclass(frozen=True)
+class Result:
+    job: Job
+    entries: int
+    unique: int
+    missing: int
+    written: bool
+    seconds: float
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Run the parse stage and then the render-and-verify stage for "
+        "tiles.ts, items.ts and walls.ts across locales in a process pool."
+    )
+    parser.add_argument("--kind", choices=KINDS, action="append")
+    parser.add_argument(
+        "--locale",
+        action="append",
+        help="target locale; repeat for several (default: zh-CN)",
+    )
+    parser.add_argument(
+        "--source-dir",
+        type=Path,
+        default=Path("src"),
+        help="directory holding the English tiles.ts, items.ts and walls.ts",
+    )
+    parser.add_argument("--cache-dir", type=Path, default=Path(".cache"))
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=Path("src"),
+        help="directory for <kind>.<locale>.ts (default: src)",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="parse and report cache coverage without rendering any output",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "--overwrite-source",
+        action="store_true",
+        help="allow an output path to point to its source (not recommended)",
+    )
+    args = parser.parse_args()
+    args.kind = args.kind or list(KINDS)
+    args.locale = args.locale or ["zh-CN"]
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    for kind in args.kind:
+        for locale in args.locale:
+            source = (args.source_dir / f"{kind}.ts").resolve()
+            output = (args.output_dir / f"{kind}.{locale}.ts").resolve()
+            if source == output and not args.overwrite_source:
+                parser.error(f"refusing to overwrite {source}; pass --overwrite-source")
+    return args
+
+
+def parse_source(module: ModuleType, kind: str, source: str) -> tuple[object, list[str]]:
+    if kind == "tiles":
+        fields = module.parse_fields(source)
+        return fields, fields.keys
+    entries = module.parse_items(source) if kind == "items" else module.parse_walls(source)
+    return entries, list(dict.fromkeys(entry.source_name for entry in entries))
+
+
+def run_job(job: Job) -> Result:
+    started = time.perf_counter()
+    module = load_script(f"translate-{job.kind}")
+    source = job.source_path.read_text(encoding="utf-8")
+    parsed, keys = parse_source(module, job.kind, source)
+    translations = module.load_cache(job.cache_path)
+    missing = sum(key not in translations for key in keys)
+    written = False
+    if not missing and not job.check_only:
+        output = module.render_output(source, parsed, translations)
+        if job.kind == "tiles":
+            module.verify_output(source, parsed, output)
+        else:
+            module.verify_output(parsed, output)
+        atomic_write_text(job.output_path, output)
+        written = True
+    return Result(
+        job=job,
+        entries=len(parsed),
+        unique=len(keys),
+        missing=missing,
+        written=written,
+        seconds=time.perf_counter() - started,
+    )
+
+
+def main() -> int:
+    args = parse_args()
+    jobs = [
+        Job(
+            kind=kind,
+            locale=locale,
+            source_path=args.source_dir / f"{kind}.ts",
+            cache_path=args.cache_dir / f"{kind}-{locale}.json",
+            output_path=args.output_dir / f"{kind}.{locale}.ts",
+            check_only=args.check,
+        )
+        for locale in args.locale
+        for kind in args.kind
+    ]
+    started = time.perf_counter()
+    incomplete = 0
+    with ProcessPoolExecutor(max_workers=min(args.jobs, len(jobs))) as executor:
+        for result in executor.map(run_job, jobs):
+            job = result.job
+            if result.missing:
+                incomplete += 1
+                status = f"{result.missing}/{result.unique} unique texts untranslated"
+            elif result.written:
+                status = f"wrote {job.output_path}"
+            else:
+                status = "fully cached"
+            print(
+                f"{job.kind} {job.locale}: {result.entries} entries, {status} "
+                f"({result.seconds:.2f}s)"
+            )
+    print(f"Finished {len(jobs)} files in {time.perf_counter() - started:.2f}s")
+    if incomplete and not args.check:
+        print(
+            f"{incomplete} files were not rendered; run the translate scripts to fill "
+            "their caches first"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except (OSError, ValueError, ImportError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        raise SystemExit(1)
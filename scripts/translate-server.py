@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""Serve tile, item and wall translations from warm caches over a local HTTP API."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+from translate_common import (
+    POISON_FAILURES,
+    BatchFailed,
+    EndpointPool,
+    RunBudget,
+    add_endpoint_arguments,
+    add_to_quarantine,
+    check_endpoint_arguments,
+    escalation_reason,
+    estimate_usage,
+    load_quarantine,
+    load_script,
+    quarantine_path,
+    save_cache,
+    save_quarantine,
+    translate_with_retries,
+)
+
+
+KINDS = ("tiles", "items", "walls")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Keep the translation caches, endpoint pool and circuit breakers "
+        "warm, and answer POST /translate batches of (field, text) pairs."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--cache-dir", type=Path, default=Path(".cache"))
+    add_endpoint_arguments(parser, 180.0, 6)
+    parser.add_argument(
+        "--batch-delay",
+        type=float,
+        default=0.05,
+        help="seconds to wait for more misses before sending a partial batch "
+        "(default: 0.05)",
+    )
+    parser.add_argument(
+        "--response-timeout",
+        type=float,
+        default=600.0,
+        help="longest a request waits for its cache misses to be translated before "
+        "answering 504 (default: 600)",
+    )
+    args = parser.parse_args()
+    check_endpoint_arguments(parser, args)
+    if args.batch_delay < 0:
+        parser.error("--batch-delay must not be negative")
+    if args.response_timeout <= 0:
+        parser.error("--response-timeout must be positive")
+    if not args.model:
+        parser.error("--model or OPENAI_MODEL is required")
+    return args
+
+
+class TranslationService:
+    def __init__(
+        self,
+        kind: str,
+        module: ModuleType,
+        args: argparse.Namespace,
+        pool: Any,
+        budget: Any,
+        executor: ThreadPoolExecutor,
+    ) -> None:
+        self.kind = kind
+        self.module = module
+        self.args = args
+        self.pool = pool
+        self.budget = budget
+        self.executor = executor
+        self.cache_path = args.cache_dir / f"{kind}-zh-CN.json"
+        self.translations = module.load_cache(self.cache_path)
+        self.quarantine = load_quarantine(quarantine_path(self.cache_path))
+        self.in_flight: dict[str, Future[str]] = {}
+        self.queue: list[tuple[str, str, str]] = []
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._condition = threading.Condition()
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+
+    def cache_key(self, field: str, text: str) -> str:
+        return f"{field}\0{text}" if self.kind == "tiles" else text
+
+    def lookup(self, field: str, text: str) -> str | Future[str]:
+        key = self.cache_key(field, text)
+        cached = self.translations.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        with self._condition:
+            cached = self.translations.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            self.misses += 1
+            future = Future()
+            entry = self.quarantine.get(key)
+            if entry is not None:
+                future.set_exception(
+                    RuntimeError(
+                        f"quarantined after failing on {entry['model']}: {entry['error']}"
+                    )
+                )
+                return future
+            self.in_flight[key] = future
+            self.queue.append((key, field, text))
+            self._condition.notify()
+            return future
+
+    def _batch_loop(self) -> None:
+        while True:
+            with self._condition:
+                while not self.queue:
+                    self._condition.wait()
+                flush_at = time.monotonic() + self.args.batch_delay
+                while len(self.queue) < self.args.batch_size:
+                    remaining = flush_at - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                rows = self.queue[: self.args.batch_size]
+                del self.queue[: self.args.batch_size]
+            self.executor.submit(self._translate, rows)
+
+    def _translate(self, rows: list[tuple[str, str, str]]) -> None:
+        kind = self.module.KIND
+        if self.kind == "tiles":
+            batch: list[Any] = rows
+        elif self.kind == "items":
+            batch = [(row_id, text) for row_id, (_, _, text) in enumerate(rows)]
+        else:
+            batch = [text for _, _, text in rows]
+        try:
+            translated, served_model = translate_with_retries(
+                self.args,
+                self.pool,
+                self.budget,
+                kind,
+                self.args.model,
+                batch,
+                estimate_usage(kind, batch),
+            )
+            with self._condition:
+                for key, _, text in rows:
+                    reason = escalation_reason(kind, text, translated[key])
+                    flags = [reason] if reason else []
+                    self.translations.record(key, translated[key], served_model, flags)
+                save_cache(self.cache_path, self.translations)
+        except Exception as error:
+            poisoned = isinstance(error, BatchFailed) and error.failure in POISON_FAILURES
+            if poisoned and len(rows) > 1:
+                middle = len(rows) // 2
+                self.executor.submit(self._translate, rows[:middle])
+                self.executor.submit(self._translate, rows[middle:])
+                return
+            if poisoned:
+                self._quarantine(rows[0][0], error)
+            with self._condition:
+                futures = [self.in_flight.pop(key) for key, _, _ in rows]
+            for future in futures:
+                future.set_exception(error)
+            return
+
+        with self._condition:
+            futures = [self.in_flight.pop(key) for key, _, _ in rows]
+        for future, (key, _, _) in zip(futures, rows):
+            future.set_result(self.translations[key])
+
+    def _quarantine(self, key: str, error: Exception) -> None:
+        path = quarantine_path(self.cache_path)
+        with self._condition:
+            add_to_quarantine(self.quarantine, key, self.args.model, error)
+            try:
+                save_quarantine(path, self.quarantine)
+            except OSError as save_error:
+                print(f"Could not save {path}: {save_error}", file=sys.stderr, flush=True)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "cached": len(self.translations),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "in_flight": len(self.in_flight),
+        }
+
+
+def make_handler(
+    services: dict[str, TranslationService], budget: Any
+) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def send_json(self, status: int, data: dict[str, Any]) -> None:
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            if self.path != "/health":
+                self.send_json(404, {"error": "not found"})
+                return
+            self.send_json(
+                200,
+                {
+                    "kinds": {kind: service.stats() for kind, service in services.items()},
+                    "prompt_tokens": budget.prompt_tokens,
+                    "cached_tokens": budget.cached_tokens,
+                    "completion_tokens": budget.completion_tokens,
+                },
+            )
+
+        def do_POST(self) -> None:
+            if self.path != "/translate":
+                self.send_json(404, {"error": "not found"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                service, rows = parse_request(services, request)
+            except (ValueError, TypeError, KeyError) as error:
+                self.send_json(400, {"error": str(error)})
+                return
+
+            results = [service.lookup(field, text) for field, text in rows]
+            deadline = time.monotonic() + service.args.response_timeout
+            try:
+                translations = [
+                    result.result(max(0.0, deadline - time.monotonic()))
+                    if isinstance(result, Future)
+                    else result
+                    for result in results
+                ]
+            except (TimeoutError, FutureTimeoutError):
+                self.send_json(504, {"error": "timed out waiting for the translation API"})
+                return
+            except Exception as error:
+                self.send_json(502, {"error": str(error)})
+                return
+            self.send_json(200, {"translations": translations})
+
+    return Handler
+
+
+def parse_request(
+    services: dict[str, TranslationService], request: Any
+) -> tuple[TranslationService, list[tuple[str, str]]]:
+    if not isinstance(request, dict) or request.get("kind") not in services:
+        raise ValueError(f"request needs a kind of {', '.join(services)}")
+    service = services[request["kind"]]
+    texts = request.get("texts")
+    if not isinstance(texts, list):
+        raise ValueError("request needs a texts array of {field, text} objects")
+    rows: list[tuple[str, str]] = []
+    for row in texts:
+        field = row.get("field", "name") if isinstance(row, dict) else None
+        text = row.get("text") if isinstance(row, dict) else None
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError("each text must be a non-empty string")
+        if service.kind == "tiles" and field not in service.module.FIELD_NAMES:
+            raise ValueError(f"tile field must be one of {service.module.FIELD_NAMES}")
+        rows.append((field, text))
+    return service, rows
+
+
+def main() -> int:
+    args = parse_args()
+    modules = {kind: load_script(f"translate-{kind}") for kind in KINDS}
+    for endpoint in args.endpoints:
+        endpoint.api_key = os.environ.get(endpoint.api_key_env, "")
+        if not endpoint.api_key:
+            raise ValueError(f"environment variable {endpoint.api_key_env} is not set")
+    pool = EndpointPool(args.endpoints, args.retry_budget)
+    budget = RunBudget(None, None, None, 0.0, 0.0)
+
+    with ThreadPoolExecutor(max_workers=pool.capacity) as executor:
+        services = {
+            kind: TranslationService(kind, module, args, pool, budget, executor)
+            for kind, module in modules.items()
+        }
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(services, budget))
+        server.daemon_threads = True
+        print(
+            f"Serving {', '.join(f'{len(s.translations)} {k}' for k, s in services.items())} "
+            f"cached translations on http://{args.host}:{server.server_address[1]}",
+            flush=True,
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except (OSError, ValueError, ImportError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        raise SystemExit(1)
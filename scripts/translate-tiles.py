@@ -4,19 +4,30 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
-import os
-import random
 import re
 import sys
-import tempfile
-import time
-import urllib.error
-import urllib.request
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from array import array
+from bisect import bisect_right
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any
+from typing import Any, Container
+
+from translate_common import (
+    PROFILER,
+    TranslationCache,
+    TranslationKind,
+    add_common_arguments,
+    atomic_write_text,
+    check_common_arguments,
+    estimate_run,
+    load_world_counts,
+    read_cache,
+    run_profiled,
+    save_cache,
+    translate_missing,
+)
 
 
 FIELD_RE = re.compile(
@@ -27,28 +38,108 @@ FIELD_RE = re.compile(
 NAME_FIELD_RE = re.compile(r"^\s*name:\s*", re.MULTILINE)
 VARIETY_FIELD_RE = re.compile(r"^\s*variety:\s*", re.MULTILINE)
 TOP_LEVEL_ID_RE = re.compile(r"^    id:\s*(-?\d+),?", re.MULTILINE)
+FIELD_NAMES = ("name", "variety")
 
 SYSTEM_PROMPT = """你是 Terraria（泰拉瑞亚）游戏本地化专家。请把方块、家具、植物、装饰物及其贴图变体名称翻译成简体中文。
 要求：
 1. 优先采用 Terraria 官方简体中文译名，保持材料、生态、家具系列和专有名词一致。
-2. field 为 name 时翻译对象名称；field 为 variety 时翻译外观、颜色、尺寸、方向、状态或样式描述。
+2. 输入按字段分组，每项为 [id, 英文文本]：name 数组是对象名称；variety 数组是外观、颜色、尺寸、方向、状态或样式描述。
 3. 只返回对应中文文本，不添加解释、注音、英文括注或无关标点。
 4. 保留数字、A/B/C 等变体标记、坐标意义和必要符号；On/Off、Left/Right、Large/Small 等应翻译。
 5. 除内部键、通用缩写或官方明确保留的品牌名外，不得直接照抄英文；专有名词应采用官方译名或合理音译。
-6. 必须返回 JSON 对象，格式严格为 {"translations":[{"id":0,"text":"土块"}]}。
-7. 每个输入 id 必须且只能出现一次，不得遗漏、修改或增加 id。"""
-
+6. 如输入含 hints，它是已缓存的相近条目译名（英文→中文），仅供保持用词一致；不要翻译或返回 hints 中的条目。
+7. 必须返回 JSON 对象，格式严格为 {"translations":[{"id":0,"text":"土块"}]}。
+8. 每个输入 id 必须且只能出现一次，不得遗漏、修改或增加 id。"""
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+class FieldTable:
+    __slots__ = (
+        "field_ids",
+        "key_ids",
+        "value_starts",
+        "value_ends",
+        "keys",
+        "key_field_ids",
+        "key_texts",
+        "_token_lookup",
+        "_text_lookup",
+    )
 
-@dataclass(frozen=True)
+    def __init__(self) -> None:
+        self.field_ids = array("B")
+        self.key_ids = array("L")
+        self.value_starts = array("Q")
+        self.value_ends = array("Q")
+        self.keys: list[str] = []
+        self.key_field_ids = array("B")
+        self.key_texts: list[str] = []
+        self._token_lookup: tuple[dict[str, int], ...] = tuple({} for _ in FIELD_NAMES)
+        self._text_lookup: tuple[dict[str, int], ...] = tuple({} for _ in FIELD_NAMES)
+
+    def append(self, field_id: int, token: str, value_start: int, value_end: int) -> None:
+        key_id = self._token_lookup[field_id].get(token)
+        if key_id is None:
+            source_text = json.loads(token)
+            key_id = self._text_lookup[field_id].get(source_text)
+            if key_id is None:
+                key_id = len(self.keys)
+                self.keys.append(f"{FIELD_NAMES[field_id]}\0{source_text}")
+                self.key_field_ids.append(field_id)
+                self.key_texts.append(source_text)
+                self._text_lookup[field_id][source_text] = key_id
+            self._token_lookup[field_id][token] = key_id
+        self.field_ids.append(field_id)
+        self.key_ids.append(key_id)
+        self.value_starts.append(value_start)
+        self.value_ends.append(value_end)
+
+    def __len__(self) -> int:
+        return len(self.field_ids)
+
+    def __getitem__(self, index: int) -> TextField:
+        if not -len(self) <= index < len(self):
+            raise IndexError("field index out of range")
+        return TextField(self, index % len(self))
+
+    def count(self, field: str) -> int:
+        return self.field_ids.count(FIELD_NAMES.index(field))
+
+    def unique_count(self, field: str) -> int:
+        return self.key_field_ids.count(FIELD_NAMES.index(field))
+
+    def key_field(self, key_id: int) -> str:
+        return FIELD_NAMES[self.key_field_ids[key_id]]
+
+
+@dataclass(frozen=True, slots=True)
 class TextField:
-    field: str
-    source_text: str
-    value_start: int
-    value_end: int
+    table: FieldTable
+    index: int
+
+    @property
+    def key_id(self) -> int:
+        return self.table.key_ids[self.index]
+
+    @property
+    def field(self) -> str:
+        return FIELD_NAMES[self.table.field_ids[self.index]]
+
+    @property
+    def source_text(self) -> str:
+        return self.table.key_texts[self.key_id]
+
+    @property
+    def value_start(self) -> int:
+        return self.table.value_starts[self.index]
+
+    @property
+    def value_end(self) -> int:
+        return self.table.value_ends[self.index]
 
     @property
     def key(self) -> str:
-        return f"{self.field}\0{self.source_text}"
+        return self.table.keys[self.key_id]
 
 
 def parse_args() -> argparse.Namespace:
@@ -60,39 +151,18 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--cache", type=Path, default=Path(".cache/tiles-zh-CN.json")
     )
-    parser.add_argument(
-        "--api-base",
-        default=os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1"),
-        help="OpenAI-compatible API base URL (default: OPENAI_BASE_URL or OpenAI)",
-    )
-    parser.add_argument(
-        "--api-key-env",
-        default="OPENAI_API_KEY",
-        help="environment variable containing the API key",
-    )
-    parser.add_argument(
-        "--model",
-        default=os.environ.get("OPENAI_MODEL"),
-        help="model name (default: OPENAI_MODEL)",
-    )
-    parser.add_argument("--batch-size", type=int, default=80)
-    parser.add_argument(
-        "--concurrency",
-        type=int,
-        default=4,
-        help="number of translation batches to request concurrently (default: 4)",
-    )
-    parser.add_argument("--timeout", type=float, default=180.0)
-    parser.add_argument("--retries", type=int, default=6)
     parser.add_argument(
         "--max-texts",
         type=int,
-        help="translate only this many unique field/text pairs for a small API test",
+        help="translate only this many unique field/text pairs, most valuable first, "
+        "for a small API test",
     )
     parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="parse and report the source structure without calling the API",
+        "--world-histogram",
+        type=Path,
+        default=Path(".cache/world-histogram.json"),
+        help="tile counts from scripts/world-histogram.py; tiles found in the sample "
+        "worlds are translated first (ignored when missing)",
     )
     parser.add_argument(
         "--retry-unchanged",
@@ -100,44 +170,35 @@ def parse_args() -> argparse.Namespace:
         help="discard cached translations identical to their English source",
     )
     parser.add_argument(
-        "--overwrite-source",
-        action="store_true",
-        help="allow --output to point to --input (not recommended)",
+        "--import-existing",
+        nargs=2,
+        type=Path,
+        metavar=("ENGLISH_SRC", "TRANSLATED_SRC"),
+        help="seed the cache from an English tiles.ts and its translated counterpart, "
+        "then exit without calling the API",
     )
+    add_common_arguments(parser, "text", 180.0, 6)
     args = parser.parse_args()
-
-    if args.batch_size < 1:
-        parser.error("--batch-size must be at least 1")
-    if args.concurrency < 1:
-        parser.error("--concurrency must be at least 1")
-    if args.retries < 1:
-        parser.error("--retries must be at least 1")
+    check_common_arguments(parser, args)
     if args.max_texts is not None and args.max_texts < 1:
         parser.error("--max-texts must be at least 1")
-    if not args.dry_run and not args.model:
-        parser.error("--model or OPENAI_MODEL is required")
-    if args.input.resolve() == args.output.resolve() and not args.overwrite_source:
-        parser.error(
-            "refusing to overwrite the source; choose another --output or pass "
-            "--overwrite-source"
-        )
     return args
 
 
-def parse_fields(source: str) -> list[TextField]:
-    fields = [
-        TextField(
-            field=match.group("field"),
-            source_text=json.loads(match.group("value")),
-            value_start=match.start("value"),
-            value_end=match.end("value"),
+def parse_fields(source: str) -> FieldTable:
+    fields = FieldTable()
+    field_ids = {field: field_id for field_id, field in enumerate(FIELD_NAMES)}
+    for match in FIELD_RE.finditer(source):
+        fields.append(
+            field_ids[match.group("field")],
+            match.group("value"),
+            match.start("value"),
+            match.end("value"),
         )
-        for match in FIELD_RE.finditer(source)
-    ]
     expected_names = len(NAME_FIELD_RE.findall(source))
     expected_varieties = len(VARIETY_FIELD_RE.findall(source))
-    parsed_names = sum(field.field == "name" for field in fields)
-    parsed_varieties = sum(field.field == "variety" for field in fields)
+    parsed_names = fields.count("name")
+    parsed_varieties = fields.count("variety")
     if (
         not fields
         or parsed_names != expected_names
@@ -159,278 +220,197 @@ def parse_top_level_ids(source: str) -> list[int]:
     return [int(value) for value in TOP_LEVEL_ID_RE.findall(source)]
 
 
-def load_cache(path: Path) -> dict[str, str]:
-    if not path.exists():
-        return {}
-    data = json.loads(path.read_text(encoding="utf-8"))
-    if data.get("version") != 1 or not isinstance(data.get("translations"), dict):
-        raise ValueError(f"unsupported cache format: {path}")
-    translations = data["translations"]
-    if not all(
-        isinstance(key, str)
-        and "\0" in key
-        and isinstance(target, str)
-        and target.strip()
-        for key, target in translations.items()
+def value_order(
+    source: str, fields: FieldTable, world_tiles: dict[int, int]
+) -> list[int]:
+    id_matches = list(TOP_LEVEL_ID_RE.finditer(source))
+    id_starts = [match.start() for match in id_matches]
+    tile_ids = [int(match.group(1)) for match in id_matches]
+    ranks = [2] * len(fields.keys)
+    shared = [0] * len(fields.keys)
+    world_cells = [0] * len(fields.keys)
+    variety_id = FIELD_NAMES.index("variety")
+    for field_id, key_id, value_start in zip(
+        fields.field_ids, fields.key_ids, fields.value_starts
     ):
-        raise ValueError(f"cache contains invalid translations: {path}")
-    return translations
-
-
-def atomic_write_text(path: Path, text: str) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with tempfile.NamedTemporaryFile(
-        mode="w",
-        encoding="utf-8",
-        newline="\n",
-        dir=path.parent,
-        prefix=f".{path.name}.",
-        suffix=".tmp",
-        delete=False,
-    ) as handle:
-        handle.write(text)
-        temporary_path = Path(handle.name)
-    temporary_path.replace(path)
-
-
-def save_cache(path: Path, translations: dict[str, str]) -> None:
-    data = {"version": 1, "translations": translations}
-    atomic_write_text(path, json.dumps(data, ensure_ascii=False, indent=2) + "\n")
-
-
-def extract_json_object(text: str) -> dict[str, Any]:
-    stripped = text.strip()
-    if stripped.startswith("```"):
-        stripped = re.sub(r"^```(?:json)?\s*", "", stripped, count=1)
-        stripped = re.sub(r"\s*```$", "", stripped, count=1)
-    try:
-        value = json.loads(stripped)
-    except json.JSONDecodeError:
-        start = stripped.find("{")
-        end = stripped.rfind("}")
-        if start < 0 or end <= start:
-            raise ValueError("model response does not contain a JSON object") from None
-        value = json.loads(stripped[start : end + 1])
-    if not isinstance(value, dict):
-        raise ValueError("model response JSON must be an object")
-    return value
-
-
-def validate_response(
-    data: dict[str, Any], batch: list[tuple[str, str, str]]
-) -> dict[str, str]:
-    rows = data.get("translations")
-    if not isinstance(rows, list):
-        raise ValueError("model response is missing a translations array")
-
-    expected_ids = set(range(len(batch)))
-    translated_by_id: dict[int, str] = {}
-    for row in rows:
-        if not isinstance(row, dict):
-            raise ValueError("each translation must be an object")
-        item_id = row.get("id")
-        text = row.get("text")
-        if not isinstance(item_id, int) or item_id not in expected_ids:
-            raise ValueError(f"unexpected translation ID: {item_id!r}")
-        if item_id in translated_by_id:
-            raise ValueError(f"duplicate translation ID: {item_id}")
-        if not isinstance(text, str) or not text.strip():
-            raise ValueError(f"translation for ID {item_id} is empty")
-        if "\n" in text or "\r" in text:
-            raise ValueError(f"translation for ID {item_id} contains a newline")
-        translated_by_id[item_id] = text.strip()
-
-    missing = expected_ids - translated_by_id.keys()
-    if missing:
-        raise ValueError(f"model response omitted IDs: {sorted(missing)}")
-    return {
-        key: translated_by_id[item_id]
-        for item_id, (key, _, _) in enumerate(batch)
-    }
-
-
-def request_translation(
-    api_base: str,
-    api_key: str,
-    model: str,
-    batch: list[tuple[str, str, str]],
-    timeout: float,
-) -> dict[str, str]:
-    user_payload = {
-        "texts": [
-            {"id": item_id, "field": field, "text": text}
-            for item_id, (_, field, text) in enumerate(batch)
-        ]
-    }
-    body = {
-        "model": model,
-        "temperature": 0,
-        "thinking": {"type": "disabled"},
-        "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": json.dumps(user_payload, ensure_ascii=False),
-            },
-        ],
-        "response_format": {"type": "json_object"},
-    }
-    request = urllib.request.Request(
-        f"{api_base.rstrip('/')}/chat/completions",
-        data=json.dumps(body, ensure_ascii=False).encode("utf-8"),
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-        method="POST",
+        if field_id != variety_id:
+            line_start = source.rfind("\n", 0, value_start) + 1
+            rank = 0 if source.startswith("    name:", line_start) else 1
+            ranks[key_id] = min(ranks[key_id], rank)
+        shared[key_id] += 1
+        tile_index = bisect_right(id_starts, value_start) - 1
+        if tile_index >= 0:
+            cells = world_tiles.get(tile_ids[tile_index], 0)
+            world_cells[key_id] = max(world_cells[key_id], cells)
+    return sorted(
+        range(len(fields.keys)),
+        key=lambda key_id: (
+            ranks[key_id],
+            not world_cells[key_id],
+            -shared[key_id],
+            -world_cells[key_id],
+            key_id,
+        ),
     )
-    with urllib.request.urlopen(request, timeout=timeout) as response:
-        response_data = json.loads(response.read().decode("utf-8"))
-    try:
-        content = response_data["choices"][0]["message"]["content"]
-    except (KeyError, IndexError, TypeError) as error:
-        raise ValueError(f"unexpected API response: {response_data!r}") from error
-    if not isinstance(content, str):
-        raise ValueError("API response message content is not text")
-    return validate_response(extract_json_object(content), batch)
-
-
-def translate_with_retries(
-    args: argparse.Namespace,
-    api_key: str,
-    batch: list[tuple[str, str, str]],
-) -> dict[str, str]:
-    last_error: Exception | None = None
-    for attempt in range(1, args.retries + 1):
-        try:
-            return request_translation(
-                args.api_base, api_key, args.model, batch, args.timeout
-            )
-        except (urllib.error.URLError, TimeoutError, ValueError, json.JSONDecodeError) as error:
-            last_error = error
-            if attempt == args.retries:
-                break
-            delay = min(30.0, 2 ** (attempt - 1)) + random.random()
-            print(
-                f"Batch failed ({attempt}/{args.retries}): {error}; "
-                f"retrying in {delay:.1f}s",
-                file=sys.stderr,
-            )
-            time.sleep(delay)
-    raise RuntimeError(f"batch failed after {args.retries} attempts: {last_error}")
+
+
+def load_cache(path: Path) -> TranslationCache:
+    return read_cache(path, KIND)
+
+
+def import_existing(
+    english_path: Path, translated_path: Path, translations: TranslationCache
+) -> tuple[int, int]:
+    english_source = english_path.read_text(encoding="utf-8")
+    translated_source = translated_path.read_text(encoding="utf-8")
+    english_fields = parse_fields(english_source)
+    translated_fields = parse_fields(translated_source)
+    if translated_fields.field_ids != english_fields.field_ids:
+        raise ValueError(
+            f"{translated_path} does not match {english_path} field-by-field"
+        )
+    if parse_top_level_ids(translated_source) != parse_top_level_ids(english_source):
+        raise ValueError(f"{translated_path} does not match {english_path} tile IDs")
+
+    imported = 0
+    conflicts = 0
+    for english_id, translated_id in zip(
+        english_fields.key_ids, translated_fields.key_ids
+    ):
+        target_text = translated_fields.key_texts[translated_id].strip()
+        if not target_text:
+            continue
+        key = english_fields.keys[english_id]
+        cached = translations.get(key)
+        if cached is None:
+            translations.record(key, target_text, None, ["imported"])
+            imported += 1
+        elif cached != target_text:
+            conflicts += 1
+    return imported, conflicts
+
+
+def user_payload(
+    batch: list[tuple[str, str, str]], hints: dict[str, str] | None = None
+) -> dict[str, Any]:
+    groups: dict[str, list[list[Any]]] = {field: [] for field in FIELD_NAMES}
+    for item_id, (_, field, text) in enumerate(batch):
+        groups[field].append([item_id, text])
+    payload: dict[str, Any] = {"hints": hints} if hints else {}
+    payload.update((field, rows) for field, rows in groups.items() if rows)
+    return payload
+
+
+KIND = TranslationKind(
+    noun="texts",
+    counted="unique texts",
+    limit_flag="--max-texts",
+    system_prompt=SYSTEM_PROMPT,
+    prompt_version=PROMPT_VERSION,
+    response_field="text",
+    key=lambda row: row[0],
+    user_payload=user_payload,
+    field_separator="\0",
+)
 
 
 def render_output(
-    source: str, fields: list[TextField], translations: dict[str, str]
+    source: str, fields: FieldTable, translations: dict[str, str]
 ) -> str:
+    target_tokens: list[str] = []
+    for key in fields.keys:
+        target_text = translations.get(key)
+        if target_text is None:
+            raise ValueError(f"missing translation for {key!r}")
+        target_tokens.append(json.dumps(target_text, ensure_ascii=False))
+
     chunks: list[str] = []
     cursor = 0
-    for field in fields:
-        target_text = translations.get(field.key)
-        if target_text is None:
-            raise ValueError(f"missing translation for {field.key!r}")
-        chunks.append(source[cursor : field.value_start])
-        chunks.append(json.dumps(target_text, ensure_ascii=False))
-        cursor = field.value_end
+    for key_id, value_start, value_end in zip(
+        fields.key_ids, fields.value_starts, fields.value_ends
+    ):
+        chunks.append(source[cursor:value_start])
+        chunks.append(target_tokens[key_id])
+        cursor = value_end
     chunks.append(source[cursor:])
     return "".join(chunks)
 
 
-def main() -> int:
-    args = parse_args()
-    source = args.input.read_text(encoding="utf-8")
-    fields = parse_fields(source)
-    source_ids = parse_top_level_ids(source)
-    unique_fields: dict[str, TextField] = {}
-    for field in fields:
-        unique_fields.setdefault(field.key, field)
-
-    name_count = sum(field.field == "name" for field in fields)
-    variety_count = sum(field.field == "variety" for field in fields)
-    unique_names = sum(field.field == "name" for field in unique_fields.values())
-    unique_varieties = sum(
-        field.field == "variety" for field in unique_fields.values()
-    )
+def verify_output(source: str, fields: FieldTable, output: str) -> None:
+    output_fields = parse_fields(output)
+    if output_fields.field_ids != fields.field_ids:
+        raise ValueError("generated output changed field count or order")
+    if parse_top_level_ids(output) != parse_top_level_ids(source):
+        raise ValueError("generated output changed tile IDs or tile order")
+
+
+def pending_rows(
+    args: argparse.Namespace, source: str, fields: FieldTable, known: Container[str]
+) -> list[tuple[str, str, str]]:
+    world_tiles = load_world_counts(args.world_histogram, "tiles")
+    pending = [
+        (fields.keys[key_id], fields.key_field(key_id), fields.key_texts[key_id])
+        for key_id in value_order(source, fields, world_tiles)
+        if fields.keys[key_id] not in known
+    ]
+    return pending if args.max_texts is None else pending[: args.max_texts]
+
+
+def run(args: argparse.Namespace) -> int:
+    with PROFILER.phase("parse"):
+        source = args.input.read_text(encoding="utf-8")
+        fields = parse_fields(source)
+        source_ids = parse_top_level_ids(source)
+        name_count = fields.count("name")
+        variety_count = fields.count("variety")
+        unique_names = fields.unique_count("name")
+        unique_varieties = fields.unique_count("variety")
     print(
         f"Parsed {len(source_ids)} tiles, {name_count} name fields "
         f"({unique_names} unique), and {variety_count} variety fields "
         f"({unique_varieties} unique); IDs {min(source_ids)}..{max(source_ids)}"
     )
-    if args.dry_run:
-        print("Dry run complete; no API request or output file was created.")
-        return 0
-
-    api_key = os.environ.get(args.api_key_env)
-    if not api_key:
-        raise ValueError(f"environment variable {args.api_key_env} is not set")
-
-    translations = load_cache(args.cache)
-    if args.retry_unchanged:
-        unchanged = [
-            key
-            for key, target_text in translations.items()
-            if key.split("\0", 1)[1] == target_text
-        ]
-        for key in unchanged:
-            del translations[key]
-        if unchanged:
-            save_cache(args.cache, translations)
-            print(f"Discarded {len(unchanged)} unchanged cached translations.")
-
-    pending = [
-        (key, field.field, field.source_text)
-        for key, field in unique_fields.items()
-        if key not in translations
-    ]
-    if args.max_texts is not None:
-        pending = pending[: args.max_texts]
-
-    batches = [
-        pending[offset : offset + args.batch_size]
-        for offset in range(0, len(pending), args.batch_size)
-    ]
-    total_batches = len(batches)
-    if batches:
-        print(
-            f"Translating {len(pending)} unique texts in {total_batches} batches "
-            f"with concurrency {min(args.concurrency, total_batches)}...",
-            flush=True,
-        )
-    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
-        futures = {
-            executor.submit(translate_with_retries, args, api_key, batch): batch_number
-            for batch_number, batch in enumerate(batches, start=1)
-        }
-        for future in as_completed(futures):
-            batch_number = futures[future]
-            translations.update(future.result())
-            save_cache(args.cache, translations)
-            print(
-                f"Completed batch {batch_number}/{total_batches}; "
-                f"cached {len(translations)}/{len(unique_fields)} unique texts",
-                flush=True,
+    if args.import_existing:
+        english_path, translated_path = args.import_existing
+        with PROFILER.phase("load_cache"):
+            translations = load_cache(args.cache)
+        with PROFILER.phase("import_existing"):
+            imported, conflicts = import_existing(
+                english_path, translated_path, translations
             )
-
-    missing_keys = [key for key in unique_fields if key not in translations]
-    if missing_keys:
+        save_cache(args.cache, translations)
+        covered = sum(key in translations for key in fields.keys)
         print(
-            f"Stopped with {len(missing_keys)} untranslated unique texts. "
-            "Run again without --max-texts to finish; the cache has been saved."
+            f"Imported {imported} translations from {translated_path} "
+            f"({conflicts} conflicting duplicates kept as cached); "
+            f"cached {covered}/{len(fields.keys)} unique texts"
         )
         return 0
 
-    output = render_output(source, fields, translations)
-    output_fields = parse_fields(output)
-    if [field.field for field in output_fields] != [field.field for field in fields]:
-        raise ValueError("generated output changed field count or order")
-    if parse_top_level_ids(output) != source_ids:
-        raise ValueError("generated output changed tile IDs or tile order")
-    atomic_write_text(args.output, output)
+    def pending(known: Container[str]) -> list[tuple[str, str, str]]:
+        return pending_rows(args, source, fields, known)
+
+    if args.dry_run:
+        return estimate_run(args, KIND, pending)
+    translations, status = translate_missing(args, KIND, fields.keys, pending)
+    if status is not None:
+        return status
+
+    with PROFILER.phase("render_output"):
+        output = render_output(source, fields, translations)
+    with PROFILER.phase("verify"):
+        verify_output(source, fields, output)
+    with PROFILER.phase("atomic_write_text"):
+        atomic_write_text(args.output, output)
     print(f"Wrote {len(fields)} translated fields to {args.output}")
     print(f"Translation cache: {args.cache}")
     return 0
 
 
+def main() -> int:
+    return run_profiled(run, parse_args())
+
+
 if __name__ == "__main__":
     try:
         raise SystemExit(main())
@@ -0,0 +1,2144 @@
+"""Shared request, budget, cache and scheduling machinery for the translate-*.py scripts."""
+
+from __future__ import annotations
+
+import argparse
+import cProfile
+import gzip
+import heapq
+import http.client
+import importlib.util
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from queue import Full, Queue, SimpleQueue
+from types import ModuleType
+from typing import Any, Callable, Container, Iterable, Iterator
+
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+LATIN_WORD_RE = re.compile(r"[A-Za-z]{2,}")
+LENGTH_RATIO_RANGE = (0.1, 2.0)
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_COOLDOWN = 30.0
+LATENCY_WINDOW = 64
+LATENCY_MIN_SAMPLES = 5
+LATENCY_QUANTILE = 0.95
+LATENCY_HEADROOM = 1.5
+MIN_REQUEST_TIMEOUT = 10.0
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MINIMUM = 10
+RETRY_DELAYS = {
+    "timeout": (0.5, 2.0),
+    "rate limit": (2.0, 60.0),
+    "server": (1.0, 30.0),
+    "connection": (1.0, 30.0),
+    "invalid response": (0.5, 4.0),
+}
+POISON_FAILURES = ("invalid response", "rejected")
+REJECTED_STATUSES = (400, 413, 422)
+QUARANTINE_PROBE_ROWS = 3
+QUARANTINE_MAX_SHARE = 0.1
+ESTIMATED_BYTES_PER_TOKEN = 3
+DEFAULT_ARCHIVE_MAX_AGE_DAYS = 180.0
+DEFAULT_ARCHIVE_MAX_ENTRIES = 20000
+HISTORY_MAX_RUNS = 200
+HINT_MIN_SIMILARITY = 0.7
+COMPOSE_MIN_SUPPORT = 3
+COMPOSE_HEAD_SHARE = 0.6
+TRANSLATIONS_ARRAY_RE = re.compile(r'"translations"\s*:\s*\[')
+SOURCE_ARRAY_RE = re.compile(r"export const \w+: \w+\[\] = (\[.*?\n\]);", re.DOTALL)
+SOURCE_KEY_RE = re.compile(r"^(\s*)(\w+):", re.MULTILINE)
+STREAM_COMMIT_INTERVAL = 0.25
+
+
+def positional_rows(batch: list[Any]) -> dict[int, Any]:
+    return dict(enumerate(batch))
+
+
+@dataclass(frozen=True)
+class TranslationKind:
+    noun: str
+    counted: str
+    limit_flag: str
+    system_prompt: str
+    prompt_version: str
+    response_field: str
+    key: Callable[[Any], str]
+    user_payload: Callable[[list[Any], dict[str, str] | None], dict[str, Any]]
+    payload_rows: Callable[[list[Any]], dict[int, Any]] = positional_rows
+    field_separator: str | None = None
+    placeholder_prefix: str | None = None
+
+    def split_key(self, key: str) -> tuple[str, str]:
+        if self.field_separator is None:
+            return "", key
+        field_name, text = key.split(self.field_separator, 1)
+        return field_name, text
+
+    def text(self, row: Any) -> str:
+        return self.split_key(self.key(row))[1]
+
+    def placeholder(self, text: str) -> bool:
+        return self.placeholder_prefix is not None and text.startswith(
+            self.placeholder_prefix
+        )
+
+
+class LatencyModel:
+    def __init__(self) -> None:
+        self.samples: deque[tuple[int, float]] = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def observe(self, tokens: int, seconds: float) -> None:
+        with self._lock:
+            self.samples.append((tokens, seconds))
+
+    def timeout(self, tokens: int, ceiling: float) -> float:
+        with self._lock:
+            samples = list(self.samples)
+        if len(samples) < LATENCY_MIN_SAMPLES:
+            return ceiling
+        mean_tokens = statistics.fmean(size for size, _ in samples)
+        mean_seconds = statistics.fmean(seconds for _, seconds in samples)
+        spread = sum((size - mean_tokens) ** 2 for size, _ in samples)
+        slope = 0.0
+        if spread:
+            covariance = sum(
+                (size - mean_tokens) * (seconds - mean_seconds) for size, seconds in samples
+            )
+            slope = max(0.0, covariance / spread)
+        intercept = mean_seconds - slope * mean_tokens
+        residuals = sorted(seconds - intercept - slope * size for size, seconds in samples)
+        margin = residuals[min(len(residuals) - 1, int(LATENCY_QUANTILE * len(residuals)))]
+        predicted = intercept + slope * tokens + max(margin, 0.0)
+        return min(ceiling, max(MIN_REQUEST_TIMEOUT, predicted * LATENCY_HEADROOM))
+
+
+class RetryBudget:
+    def __init__(self, ratio: float) -> None:
+        self.ratio = ratio
+        self.requests = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def try_retry(self) -> bool:
+        with self._lock:
+            if self.retries >= RETRY_BUDGET_MINIMUM + self.ratio * self.requests:
+                return False
+            self.retries += 1
+            return True
+
+
+class BatchFailed(RuntimeError):
+    def __init__(self, message: str, failure: str) -> None:
+        super().__init__(message)
+        self.failure = failure
+
+
+@dataclass
+class Endpoint:
+    api_base: str
+    api_key_env: str
+    model: str | None
+    concurrency: int
+    weight: float
+    api_key: str = ""
+    in_flight: int = 0
+    failures: int = 0
+    open_until: float = 0.0
+    probing: bool = False
+    refused: bool = False
+    completed: int = 0
+    latency: LatencyModel = field(default_factory=LatencyModel)
+
+    @property
+    def label(self) -> str:
+        return f"{self.api_base} [{self.api_key_env}]"
+
+
+class EndpointPool:
+    def __init__(
+        self, endpoints: list[Endpoint], retry_ratio: float = RETRY_BUDGET_RATIO
+    ) -> None:
+        self.endpoints = endpoints
+        self.capacity = sum(endpoint.concurrency for endpoint in endpoints)
+        self.retry_budget = RetryBudget(retry_ratio)
+        self._condition = threading.Condition()
+
+    def _available(self, endpoint: Endpoint, now: float) -> bool:
+        if endpoint.refused or endpoint.in_flight >= endpoint.concurrency:
+            return False
+        if endpoint.failures < CIRCUIT_FAILURE_THRESHOLD:
+            return True
+        return now >= endpoint.open_until and not endpoint.probing
+
+    def acquire(self, deadline: float | None = None) -> Endpoint | None:
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    return None
+                if self.refused:
+                    return None
+                candidates = [
+                    endpoint
+                    for endpoint in self.endpoints
+                    if self._available(endpoint, now)
+                ]
+                if candidates:
+                    endpoint = min(
+                        candidates,
+                        key=lambda candidate: (candidate.in_flight + 1) / candidate.weight,
+                    )
+                    if endpoint.failures >= CIRCUIT_FAILURE_THRESHOLD:
+                        endpoint.probing = True
+                    endpoint.in_flight += 1
+                    return endpoint
+                wait_times = [
+                    endpoint.open_until - now
+                    for endpoint in self.endpoints
+                    if endpoint.open_until > now
+                ]
+                if deadline is not None:
+                    wait_times.append(deadline - now)
+                self._condition.wait(min(wait_times, default=None))
+
+    def release(self, endpoint: Endpoint, healthy: bool) -> None:
+        with self._condition:
+            endpoint.in_flight -= 1
+            endpoint.probing = False
+            if healthy:
+                endpoint.failures = 0
+                endpoint.completed += 1
+            else:
+                endpoint.failures += 1
+                if endpoint.failures >= CIRCUIT_FAILURE_THRESHOLD:
+                    cooldown = CIRCUIT_COOLDOWN * 2 ** min(
+                        endpoint.failures - CIRCUIT_FAILURE_THRESHOLD, 4
+                    )
+                    endpoint.open_until = time.monotonic() + cooldown
+                    print(
+                        f"Endpoint {endpoint.label} failed {endpoint.failures} times "
+                        f"in a row; ejecting it for {cooldown:.0f}s",
+                        file=sys.stderr,
+                    )
+            self._condition.notify_all()
+
+    @property
+    def refused(self) -> bool:
+        return all(endpoint.refused for endpoint in self.endpoints)
+
+    def refuse(self, endpoint: Endpoint, error: Exception) -> None:
+        with self._condition:
+            if not endpoint.refused:
+                endpoint.refused = True
+                print(
+                    f"Endpoint {endpoint.label} refused the request ({error}); "
+                    "removing it for the rest of the run",
+                    file=sys.stderr,
+                )
+            self._condition.notify_all()
+
+    def has_alternative(self, endpoint: Endpoint) -> bool:
+        with self._condition:
+            now = time.monotonic()
+            return any(
+                other is not endpoint
+                and other.failures < CIRCUIT_FAILURE_THRESHOLD
+                and self._available(other, now)
+                for other in self.endpoints
+            )
+
+
+class RunBudget:
+    def __init__(
+        self,
+        deadline: float | None,
+        max_tokens: int | None,
+        max_cost: float | None,
+        input_price: float,
+        output_price: float,
+        cached_input_price: float | None = None,
+    ) -> None:
+        self.deadline = None if deadline is None else time.monotonic() + deadline
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.input_price = input_price
+        self.output_price = output_price
+        self.cached_input_price = (
+            input_price if cached_input_price is None else cached_input_price
+        )
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.reserved_tokens = 0
+        self.reserved_cost = 0.0
+        self.stop_reason: str | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def limited(self) -> bool:
+        return any(
+            limit is not None for limit in (self.deadline, self.max_tokens, self.max_cost)
+        )
+
+    @property
+    def cost(self) -> float:
+        discount = (self.input_price - self.cached_input_price) * self.cached_tokens
+        return (
+            self.usage_cost((self.prompt_tokens, self.completion_tokens))
+            - discount / 1_000_000
+        )
+
+    def usage_cost(self, usage: tuple[int, int]) -> float:
+        return (usage[0] * self.input_price + usage[1] * self.output_price) / 1_000_000
+
+    def remaining_time(self) -> float | None:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def _exceeded(self, extra_tokens: int, extra_cost: float) -> str | None:
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return "deadline"
+        used_tokens = self.prompt_tokens + self.completion_tokens + extra_tokens
+        if self.max_tokens is not None and used_tokens > self.max_tokens:
+            return "token budget"
+        if self.max_cost is not None and self.cost + extra_cost > self.max_cost:
+            return "cost budget"
+        return None
+
+    def reserve(self, estimate: tuple[int, int]) -> bool:
+        with self._lock:
+            if self.stop_reason is not None:
+                return False
+            reason = self._exceeded(
+                self.reserved_tokens + sum(estimate),
+                self.reserved_cost + self.usage_cost(estimate),
+            )
+            if reason is None:
+                self.reserved_tokens += sum(estimate)
+                self.reserved_cost += self.usage_cost(estimate)
+                return True
+            if reason == "deadline" or not self.reserved_tokens:
+                self.stop_reason = reason
+            return False
+
+    def release(self, estimate: tuple[int, int]) -> None:
+        with self._lock:
+            self.reserved_tokens -= sum(estimate)
+            self.reserved_cost -= self.usage_cost(estimate)
+
+    def charge(self, usage: tuple[int, int, int]) -> None:
+        with self._lock:
+            self.prompt_tokens += usage[0]
+            self.completion_tokens += usage[1]
+            self.cached_tokens += usage[2]
+
+    def exhausted(self) -> str | None:
+        with self._lock:
+            if self.stop_reason is None:
+                self.stop_reason = self._exceeded(0, 0.0)
+            return self.stop_reason
+
+
+class PhaseProfiler:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.trace_memory = False
+        self.phases: dict[str, list[float]] = {}
+        self.events: list[dict[str, Any]] | None = None
+        self.threads: dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._started = 0.0
+
+    def start(self, trace_memory: bool, trace_events: bool = False) -> None:
+        self.enabled = True
+        self.trace_memory = trace_memory
+        if trace_memory:
+            tracemalloc.start()
+        if trace_events:
+            self.events = []
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str, details: dict[str, Any] | None = None) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        memory_before = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            memory_after = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+            self.record(name, time.perf_counter() - started, memory_after - memory_before)
+            self.trace(name, started, details)
+
+    def record(self, name: str, elapsed: float, memory_delta: int = 0) -> None:
+        with self._lock:
+            totals = self.phases.setdefault(name, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += elapsed
+            totals[2] += memory_delta
+
+    def timestamp(self, moment: float) -> float:
+        return round((moment - self._started) * 1e6, 1)
+
+    def trace(
+        self, name: str, started: float, details: dict[str, Any] | None = None
+    ) -> None:
+        if self.events is None:
+            return
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": self.timestamp(started),
+            "dur": self.timestamp(time.perf_counter()) - self.timestamp(started),
+            "pid": os.getpid(),
+            "tid": thread.ident,
+        }
+        if details is not None:
+            event["args"] = details
+        with self._lock:
+            self.threads[thread.ident or 0] = thread.name
+            self.events.append(event)
+
+    def trace_span(
+        self, name: str, span_id: int, started: float, details: dict[str, Any]
+    ) -> None:
+        if self.events is None:
+            return
+        shared = {"name": name, "cat": "batch", "id": span_id, "pid": os.getpid()}
+        with self._lock:
+            self.events.append(
+                {**shared, "ph": "b", "ts": self.timestamp(started), "args": details}
+            )
+            self.events.append(
+                {**shared, "ph": "e", "ts": self.timestamp(time.perf_counter())}
+            )
+
+    def chrome_trace(self) -> str:
+        with self._lock:
+            names = [
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": ident,
+                    "args": {"name": name},
+                }
+                for ident, name in self.threads.items()
+            ]
+            events = [*names, *(self.events or [])]
+        return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}) + "\n"
+
+    def report(self) -> str:
+        header = f"Profile: {time.perf_counter() - self._started:.2f}s wall"
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            header += f", traced memory peak {peak / 2**20:.1f} MiB"
+        lines = [
+            header,
+            f"  {'phase':<30} {'calls':>6} {'total':>10} {'mean':>10}"
+            + (f" {'memory':>10}" if self.trace_memory else ""),
+        ]
+        for name, (calls, total, memory_delta) in self.phases.items():
+            line = f"  {name:<30} {int(calls):>6} {total:>9.3f}s {total / calls:>9.3f}s"
+            if self.trace_memory:
+                line += f" {memory_delta / 2**20:>+6.1f} MiB"
+            lines.append(line)
+        lines.append("  (worker) phases are summed across concurrent workers")
+        return "\n".join(lines)
+
+
+PROFILER = PhaseProfiler()
+
+
+def load_script(name: str) -> ModuleType:
+    module_name = name.replace("-", "_")
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, SCRIPTS_DIR / f"{name}.py")
+    if spec is None or spec.loader is None:
+        raise ImportError(f"cannot load {name}.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def add_endpoint_arguments(
+    parser: argparse.ArgumentParser, timeout: float, retries: int
+) -> None:
+    parser.add_argument(
+        "--api-base",
+        default=os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+        help="OpenAI-compatible API base URL (default: OPENAI_BASE_URL or OpenAI)",
+    )
+    parser.add_argument(
+        "--api-key-env",
+        default="OPENAI_API_KEY",
+        help="environment variable containing the API key",
+    )
+    parser.add_argument(
+        "--model",
+        default=os.environ.get("OPENAI_MODEL"),
+        help="model name (default: OPENAI_MODEL)",
+    )
+    parser.add_argument(
+        "--endpoint",
+        action="append",
+        default=[],
+        metavar="SPEC",
+        help="add BASE_URL[,key_env=VAR][,model=NAME][,concurrency=N][,weight=W] to "
+        "the load-balanced endpoint pool; repeat for more endpoints (default: one "
+        "endpoint from --api-base and --api-key-env). model= replaces --model there",
+    )
+    parser.add_argument("--batch-size", type=int, default=80)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="number of translation batches to request concurrently, per endpoint "
+        "unless overridden (default: 4)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=timeout,
+        help="longest a request may take; once an endpoint has completed a few "
+        "batches, each request's timeout follows that endpoint's observed latency "
+        f"for the batch size (default: {timeout:g})",
+    )
+    parser.add_argument(
+        "--gzip-requests",
+        action="store_true",
+        help="send gzip-compressed request bodies (the API must accept "
+        "Content-Encoding: gzip)",
+    )
+    parser.add_argument("--retries", type=int, default=retries)
+    parser.add_argument(
+        "--retry-budget",
+        type=float,
+        default=RETRY_BUDGET_RATIO,
+        help="across the run, allow retries up to this fraction of first attempts "
+        f"plus {RETRY_BUDGET_MINIMUM} (default: {RETRY_BUDGET_RATIO:g})",
+    )
+
+
+def add_common_arguments(
+    parser: argparse.ArgumentParser, noun: str, timeout: float, retries: int
+) -> None:
+    add_endpoint_arguments(parser, timeout, retries)
+    parser.add_argument(
+        "--escalate-model",
+        action="append",
+        default=[],
+        help=f"stronger model for {noun}s that fail or look suspicious on the previous "
+        "model; repeat to add further tiers",
+    )
+    parser.add_argument(
+        "--hints",
+        type=int,
+        default=1,
+        help="attach up to this many cached near-match translations per pending "
+        f"{noun} to each batch as consistency hints; 0 disables (default: 1)",
+    )
+    parser.add_argument(
+        "--compose",
+        action="store_true",
+        help="translate pending compounds such as 'Ebonwood Chair' locally from cached "
+        "modifier and head translations when the composition is confident enough; "
+        "less confident ones go to the model with the components as hints",
+    )
+    parser.add_argument(
+        "--compose-threshold",
+        type=float,
+        default=0.8,
+        help="held-out accuracy a composition needs with --compose to be cached "
+        "without asking the model (default: 0.8)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="request streamed completions and cache each row as soon as it arrives; "
+        "a failed batch retries only the rows not yet received",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        metavar="SECONDS",
+        help="stop submitting batches and retrying after this many seconds of "
+        "wall-clock time, keeping everything translated so far",
+    )
+    parser.add_argument(
+        "--max-tokens",
+        type=int,
+        help="stop before the reported prompt plus completion tokens exceed this",
+    )
+    parser.add_argument(
+        "--max-cost",
+        type=float,
+        help="stop before the estimated spend exceeds this; needs --input-price or "
+        "--output-price",
+    )
+    parser.add_argument(
+        "--input-price",
+        type=float,
+        default=0.0,
+        help="price per million prompt tokens, for --max-cost and the usage report",
+    )
+    parser.add_argument(
+        "--output-price",
+        type=float,
+        default=0.0,
+        help="price per million completion tokens, for --max-cost and the usage report",
+    )
+    parser.add_argument(
+        "--cached-input-price",
+        type=float,
+        help="price per million prompt tokens the API reports as served from its "
+        "prompt cache (default: --input-price)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="report the source structure and estimate the pending batches, tokens, "
+        "cost and wall-clock time from the run history, without calling the API",
+    )
+    parser.add_argument(
+        "--retry-quarantine",
+        action="store_true",
+        help=f"translate only the {noun}s quarantined after their batches kept failing",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print a per-phase timing breakdown when the run ends",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="with --profile, also track per-phase allocations using tracemalloc",
+    )
+    parser.add_argument(
+        "--profile-stats",
+        type=Path,
+        help="with --profile, also write a cProfile/pstats dump of the main thread here",
+    )
+    parser.add_argument(
+        "--trace-out",
+        type=Path,
+        help="with --profile, also write a Chrome trace-event timeline of every batch "
+        "attempt, worker wait and main-loop phase here (open it in Perfetto or "
+        "chrome://tracing)",
+    )
+    parser.add_argument(
+        "--no-gc",
+        action="store_true",
+        help=f"keep cached translations whose source {noun} no longer appears in --input "
+        "instead of moving them to the cold archive next to --cache",
+    )
+    parser.add_argument(
+        "--archive-max-age-days",
+        type=float,
+        default=DEFAULT_ARCHIVE_MAX_AGE_DAYS,
+        help="evict archived translations older than this "
+        f"(default: {DEFAULT_ARCHIVE_MAX_AGE_DAYS:g})",
+    )
+    parser.add_argument(
+        "--archive-max-entries",
+        type=int,
+        default=DEFAULT_ARCHIVE_MAX_ENTRIES,
+        help="evict the oldest archived translations beyond this many "
+        f"(default: {DEFAULT_ARCHIVE_MAX_ENTRIES})",
+    )
+    parser.add_argument(
+        "--overwrite-source",
+        action="store_true",
+        help="allow --output to point to --input (not recommended)",
+    )
+
+
+def check_endpoint_arguments(
+    parser: argparse.ArgumentParser, args: argparse.Namespace
+) -> None:
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.retries < 1:
+        parser.error("--retries must be at least 1")
+    if args.retry_budget < 0:
+        parser.error("--retry-budget must not be negative")
+    try:
+        args.endpoints = [
+            parse_endpoint(spec, args.api_key_env, args.concurrency)
+            for spec in args.endpoint
+        ] or [Endpoint(args.api_base, args.api_key_env, None, args.concurrency, 1.0)]
+    except ValueError as error:
+        parser.error(str(error))
+
+
+def check_common_arguments(
+    parser: argparse.ArgumentParser, args: argparse.Namespace
+) -> None:
+    check_endpoint_arguments(parser, args)
+    if args.hints < 0:
+        parser.error("--hints must not be negative")
+    if not 0 < args.compose_threshold <= 1:
+        parser.error("--compose-threshold must be in (0, 1]")
+    if args.profile_memory or args.profile_stats or args.trace_out:
+        args.profile = True
+    if args.archive_max_age_days < 0 or args.archive_max_entries < 0:
+        parser.error("--archive-max-age-days and --archive-max-entries must not be negative")
+    if args.deadline is not None and args.deadline <= 0:
+        parser.error("--deadline must be positive")
+    if args.max_tokens is not None and args.max_tokens < 1:
+        parser.error("--max-tokens must be at least 1")
+    if args.input_price < 0 or args.output_price < 0 or (args.cached_input_price or 0) < 0:
+        parser.error("token prices must not be negative")
+    if args.max_cost is not None and (
+        args.max_cost <= 0 or not args.input_price and not args.output_price
+    ):
+        parser.error("--max-cost must be positive and needs --input-price or --output-price")
+    if not args.dry_run and not args.import_existing and not args.model:
+        parser.error("--model or OPENAI_MODEL is required")
+    if args.input.resolve() == args.output.resolve() and not args.overwrite_source:
+        parser.error(
+            "refusing to overwrite the source; choose another --output or pass "
+            "--overwrite-source"
+        )
+
+
+def parse_endpoint(spec: str, api_key_env: str, concurrency: int) -> Endpoint:
+    api_base, *options = spec.split(",")
+    settings: dict[str, str | None] = {
+        "key_env": api_key_env,
+        "model": None,
+        "concurrency": str(concurrency),
+        "weight": "1",
+    }
+    for option in options:
+        name, separator, value = option.partition("=")
+        name = name.strip().replace("-", "_")
+        if not separator or name not in settings or not value.strip():
+            raise ValueError(f"invalid --endpoint option {option!r} in {spec!r}")
+        settings[name] = value.strip()
+    try:
+        endpoint_concurrency = int(settings["concurrency"] or "")
+        weight = float(settings["weight"] or "")
+    except ValueError:
+        raise ValueError(f"invalid --endpoint concurrency or weight in {spec!r}") from None
+    if not api_base.strip() or endpoint_concurrency < 1 or weight <= 0:
+        raise ValueError(f"invalid --endpoint {spec!r}")
+    return Endpoint(
+        api_base=api_base.strip(),
+        api_key_env=settings["key_env"] or api_key_env,
+        model=settings["model"],
+        concurrency=endpoint_concurrency,
+        weight=weight,
+    )
+
+
+def load_source_entries(path: Path) -> list[dict[str, Any]]:
+    source = path.read_text(encoding="utf-8")
+    match = SOURCE_ARRAY_RE.search(source)
+    if not match:
+        raise ValueError(f"unsupported structure: {path}")
+    try:
+        entries = json.loads(SOURCE_KEY_RE.sub(r'\1"\2":', match.group(1)))
+    except json.JSONDecodeError as error:
+        raise ValueError(f"unsupported structure: {path}: {error}") from None
+    if not isinstance(entries, list) or not all(
+        isinstance(entry, dict) and isinstance(entry.get("id"), int) for entry in entries
+    ):
+        raise ValueError(f"unsupported structure: {path}")
+    return entries
+
+
+def load_world_counts(path: Path, section: str) -> dict[int, int]:
+    if not path.exists():
+        return {}
+    data = json.loads(path.read_text(encoding="utf-8"))
+    counts = data.get(section) if isinstance(data, dict) else None
+    if (
+        not isinstance(counts, dict)
+        or data.get("version") != 1
+        or not all(key.lstrip("-").isdigit() for key in counts)
+        or not all(isinstance(count, int) for count in counts.values())
+    ):
+        raise ValueError(f"unsupported world histogram format: {path}")
+    return {int(key): count for key, count in counts.items()}
+
+
+class TranslationCache(dict[str, str]):
+    def __init__(
+        self,
+        translations: dict[str, str] | None = None,
+        metadata: dict[str, dict[str, Any]] | None = None,
+        prompt: str | None = None,
+    ) -> None:
+        super().__init__(translations or {})
+        self.metadata = metadata or {}
+        self.prompt = prompt
+
+    def record(self, key: str, text: str, model: str | None, flags: list[str]) -> None:
+        self[key] = text
+        self.metadata[key] = {
+            "model": model,
+            "prompt": None if model is None else self.prompt,
+            "translated_at": time.time(),
+            "flags": flags,
+        }
+
+    def live_metadata(self) -> dict[str, dict[str, Any]]:
+        return {key: entry for key, entry in self.metadata.items() if key in self}
+
+
+def read_cache(path: Path, kind: TranslationKind) -> TranslationCache:
+    if not path.exists():
+        return TranslationCache(prompt=kind.prompt_version)
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if data.get("version") not in (1, 2) or not isinstance(data.get("translations"), dict):
+        raise ValueError(f"unsupported cache format: {path}")
+    translations = data["translations"]
+    metadata = data.get("metadata", {})
+    if not all(
+        isinstance(key, str)
+        and (kind.field_separator is None or kind.field_separator in key)
+        and isinstance(target, str)
+        and target.strip()
+        for key, target in translations.items()
+    ):
+        raise ValueError(f"cache contains invalid translations: {path}")
+    if not isinstance(metadata, dict) or not all(
+        isinstance(entry, dict) for entry in metadata.values()
+    ):
+        raise ValueError(f"cache contains invalid metadata: {path}")
+    return TranslationCache(translations, metadata, kind.prompt_version)
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        mode="w",
+        encoding="utf-8",
+        newline="\n",
+        dir=path.parent,
+        prefix=f".{path.name}.",
+        suffix=".tmp",
+        delete=False,
+    ) as handle:
+        handle.write(text)
+        temporary_path = Path(handle.name)
+    temporary_path.replace(path)
+
+
+def save_cache(path: Path, translations: TranslationCache) -> None:
+    data = {
+        "version": 2,
+        "translations": translations,
+        "metadata": translations.live_metadata(),
+    }
+    with PROFILER.phase("save_cache json.dumps"):
+        text = json.dumps(data, ensure_ascii=False, indent=2) + "\n"
+    with PROFILER.phase("save_cache write"):
+        atomic_write_text(path, text)
+
+
+class CacheWriter:
+    def __init__(self, path: Path, translations: TranslationCache) -> None:
+        self.path = path
+        self.translations = translations
+        self.lock = threading.Lock()
+        self.commits: Queue[bool] = Queue(maxsize=1)
+        self.error: BaseException | None = None
+        self._thread = threading.Thread(target=self._run, name="cache writer", daemon=True)
+        self._thread.start()
+
+    def commit(self) -> None:
+        if self.error is not None:
+            raise self.error
+        try:
+            self.commits.put_nowait(True)
+        except Full:
+            pass
+
+    def __enter__(self) -> CacheWriter:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        while self._thread.is_alive():
+            try:
+                self.commits.put(False, timeout=0.1)
+                break
+            except Full:
+                pass
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self) -> None:
+        try:
+            while self.commits.get():
+                with self.lock:
+                    snapshot = TranslationCache(
+                        self.translations, dict(self.translations.metadata)
+                    )
+                try:
+                    save_cache(self.path, snapshot)
+                except OSError as error:
+                    self.error = error
+        except BaseException as error:
+            self.error = error
+
+
+def archive_path(cache_path: Path) -> Path:
+    return cache_path.with_name(f"{cache_path.stem}.archive{cache_path.suffix}")
+
+
+def load_archive(path: Path) -> dict[str, dict[str, Any]]:
+    if not path.exists():
+        return {}
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if data.get("version") != 1 or not isinstance(data.get("entries"), dict):
+        raise ValueError(f"unsupported cache archive format: {path}")
+    entries = data["entries"]
+    if not all(
+        isinstance(entry, dict)
+        and isinstance(entry.get("text"), str)
+        and isinstance(entry.get("archived_at"), (int, float))
+        for entry in entries.values()
+    ):
+        raise ValueError(f"cache archive contains invalid entries: {path}")
+    return entries
+
+
+def save_archive(path: Path, entries: dict[str, dict[str, Any]]) -> None:
+    data = {"version": 1, "entries": entries}
+    atomic_write_text(path, json.dumps(data, ensure_ascii=False, indent=2) + "\n")
+
+
+def evict_archive(
+    entries: dict[str, dict[str, Any]], max_age_days: float, max_entries: int, now: float
+) -> int:
+    cutoff = now - max_age_days * 86400
+    expired = [key for key, entry in entries.items() if entry["archived_at"] < cutoff]
+    for key in expired:
+        del entries[key]
+    overflow = sorted(entries, key=lambda key: entries[key]["archived_at"])[
+        : max(len(entries) - max_entries, 0)
+    ]
+    for key in overflow:
+        del entries[key]
+    return len(expired) + len(overflow)
+
+
+def collect_garbage(
+    cache_path: Path,
+    translations: TranslationCache,
+    live_keys: set[str],
+    max_age_days: float,
+    max_entries: int,
+) -> tuple[int, int]:
+    stale = [key for key in translations if key not in live_keys]
+    if not stale:
+        return 0, 0
+    path = archive_path(cache_path)
+    entries = load_archive(path)
+    now = time.time()
+    for key in stale:
+        entries[key] = {
+            "text": translations.pop(key),
+            "archived_at": now,
+            "metadata": translations.metadata.pop(key, None),
+        }
+    evicted = evict_archive(entries, max_age_days, max_entries, now)
+    save_archive(path, entries)
+    save_cache(cache_path, translations)
+    return len(stale), evicted
+
+
+def restore_archived(
+    cache_path: Path, translations: TranslationCache, wanted_keys: list[str]
+) -> int:
+    path = archive_path(cache_path)
+    entries = load_archive(path)
+    restored = [key for key in wanted_keys if key in entries]
+    for key in restored:
+        entry = entries.pop(key)
+        translations[key] = entry["text"]
+        if isinstance(entry.get("metadata"), dict):
+            translations.metadata[key] = entry["metadata"]
+    if restored:
+        save_cache(cache_path, translations)
+        save_archive(path, entries)
+    return len(restored)
+
+
+def quarantine_path(cache_path: Path) -> Path:
+    return cache_path.with_name(f"{cache_path.stem}.quarantine{cache_path.suffix}")
+
+
+def load_quarantine(path: Path) -> dict[str, dict[str, Any]]:
+    if not path.exists():
+        return {}
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if data.get("version") != 1 or not isinstance(data.get("entries"), dict):
+        raise ValueError(f"unsupported quarantine format: {path}")
+    return data["entries"]
+
+
+def add_to_quarantine(
+    entries: dict[str, dict[str, Any]], key: str, model: str, error: Exception
+) -> None:
+    entries[key] = {
+        "model": model,
+        "error": str(error),
+        "attempts": entries.get(key, {}).get("attempts", 0) + 1,
+        "quarantined_at": round(time.time(), 3),
+    }
+
+
+def save_quarantine(path: Path, entries: dict[str, dict[str, Any]]) -> None:
+    if not entries:
+        path.unlink(missing_ok=True)
+        return
+    data = {"version": 1, "entries": entries}
+    atomic_write_text(path, json.dumps(data, ensure_ascii=False, indent=2) + "\n")
+
+
+def history_path(cache_path: Path) -> Path:
+    return cache_path.with_name(f"{cache_path.stem}.history{cache_path.suffix}")
+
+
+def load_history(path: Path) -> list[dict[str, Any]]:
+    if not path.exists():
+        return []
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if data.get("version") != 1 or not isinstance(data.get("runs"), list):
+        raise ValueError(f"unsupported run history format: {path}")
+    return [entry for entry in data["runs"] if isinstance(entry, dict)]
+
+
+def record_run(
+    args: argparse.Namespace,
+    pool: EndpointPool,
+    budget: RunBudget,
+    finished: list[tuple[int, float, tuple[int, int]]],
+    wall_seconds: float,
+) -> None:
+    if not finished:
+        return
+    path = history_path(args.cache)
+    try:
+        runs = load_history(path)[-(HISTORY_MAX_RUNS - 1) :]
+        runs.append(
+            {
+                "recorded_at": round(time.time(), 3),
+                "model": args.model,
+                "batch_size": args.batch_size,
+                "concurrency": pool.capacity,
+                "batches": len(finished),
+                "texts": sum(texts for texts, _, _ in finished),
+                "batch_seconds": round(sum(seconds for _, seconds, _ in finished), 3),
+                "wall_seconds": round(wall_seconds, 3),
+                "prompt_tokens": budget.prompt_tokens,
+                "completion_tokens": budget.completion_tokens,
+                "cached_tokens": budget.cached_tokens,
+                "estimated_prompt_tokens": sum(estimate[0] for _, _, estimate in finished),
+            }
+        )
+        atomic_write_text(path, json.dumps({"version": 1, "runs": runs}, indent=2) + "\n")
+    except (OSError, ValueError) as error:
+        print(f"Could not record run history in {path}: {error}", file=sys.stderr)
+
+
+def extract_json_object(text: str) -> dict[str, Any]:
+    stripped = text.strip()
+    if stripped.startswith("```"):
+        stripped = re.sub(r"^```(?:json)?\s*", "", stripped, count=1)
+        stripped = re.sub(r"\s*```$", "", stripped, count=1)
+    try:
+        value = json.loads(stripped)
+    except json.JSONDecodeError:
+        start = stripped.find("{")
+        end = stripped.rfind("}")
+        if start < 0 or end <= start:
+            raise ValueError("model response does not contain a JSON object") from None
+        value = json.loads(stripped[start : end + 1])
+    if not isinstance(value, dict):
+        raise ValueError("model response JSON must be an object")
+    return value
+
+
+def validate_row(
+    row: Any, expected_ids: set[int], translated_by_id: dict[int, str], field_name: str
+) -> int:
+    if not isinstance(row, dict):
+        raise ValueError("each translation must be an object")
+    item_id = row.get("id")
+    text = row.get(field_name)
+    if not isinstance(item_id, int) or item_id not in expected_ids:
+        raise ValueError(f"unexpected translation ID: {item_id!r}")
+    if item_id in translated_by_id:
+        raise ValueError(f"duplicate translation ID: {item_id}")
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError(f"translation for ID {item_id} is empty")
+    if "\n" in text or "\r" in text:
+        raise ValueError(f"translation for ID {item_id} contains a newline")
+    translated_by_id[item_id] = text.strip()
+    return item_id
+
+
+def validate_response(
+    kind: TranslationKind, data: dict[str, Any], batch: list[Any]
+) -> dict[str, str]:
+    rows = data.get("translations")
+    if not isinstance(rows, list):
+        raise ValueError("model response is missing a translations array")
+
+    rows_by_id = kind.payload_rows(batch)
+    expected_ids = set(rows_by_id)
+    translated_by_id: dict[int, str] = {}
+    for row in rows:
+        validate_row(row, expected_ids, translated_by_id, kind.response_field)
+
+    missing = expected_ids - translated_by_id.keys()
+    if missing:
+        raise ValueError(f"model response omitted IDs: {sorted(missing)}")
+    return {
+        kind.key(rows_by_id[item_id]): text for item_id, text in translated_by_id.items()
+    }
+
+
+class TranslationRowStream:
+    def __init__(self) -> None:
+        self.buffer = ""
+        self.position = -1
+
+    def feed(self, text: str) -> list[Any]:
+        self.buffer += text
+        if self.position < 0:
+            match = TRANSLATIONS_ARRAY_RE.search(self.buffer)
+            if match is None:
+                return []
+            self.position = match.end()
+        rows: list[Any] = []
+        while True:
+            start = self.buffer.find("{", self.position)
+            end = -1 if start < 0 else json_object_end(self.buffer, start)
+            if end < 0:
+                return rows
+            rows.append(json.loads(self.buffer[start:end]))
+            self.position = end
+
+
+def json_object_end(text: str, start: int) -> int:
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return -1
+
+
+def reported_usage(data: dict[str, Any]) -> tuple[int, int, int] | None:
+    usage = data.get("usage")
+    if not isinstance(usage, dict) or not all(
+        isinstance(usage.get(name), int) for name in ("prompt_tokens", "completion_tokens")
+    ):
+        return None
+    details = usage.get("prompt_tokens_details")
+    cached = details.get("cached_tokens") if isinstance(details, dict) else None
+    if not isinstance(cached, int):
+        cached = usage.get("prompt_cache_hit_tokens")
+    return (
+        usage["prompt_tokens"],
+        usage["completion_tokens"],
+        cached if isinstance(cached, int) else 0,
+    )
+
+
+def read_event_stream(
+    response: Any, on_content: Callable[[str], None]
+) -> tuple[str, tuple[int, int, int] | None]:
+    content: list[str] = []
+    reported = None
+    for raw_line in response:
+        line = raw_line.decode("utf-8").strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:") :].strip()
+        if data == "[DONE]":
+            break
+        chunk = json.loads(data)
+        if not isinstance(chunk, dict):
+            raise ValueError(f"unexpected API stream chunk: {chunk!r}")
+        reported = reported_usage(chunk) or reported
+        for choice in chunk.get("choices") or []:
+            delta = (choice.get("delta") or {}).get("content")
+            if isinstance(delta, str) and delta:
+                content.append(delta)
+                on_content(delta)
+    return "".join(content), reported
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text.lower()} "
+    return {padded[index : index + 3] for index in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    def __init__(self) -> None:
+        self.keys: list[str] = []
+        self.groups: list[str] = []
+        self.sizes: list[int] = []
+        self.ids: dict[str, int] = {}
+        self.postings: dict[str, list[int]] = defaultdict(list)
+
+    def add(self, key: str, text: str, group: str = "") -> None:
+        if key in self.ids:
+            return
+        entry_id = len(self.keys)
+        grams = trigrams(text)
+        self.ids[key] = entry_id
+        self.keys.append(key)
+        self.groups.append(group)
+        self.sizes.append(len(grams))
+        for gram in grams:
+            self.postings[gram].append(entry_id)
+
+    def query(self, text: str, group: str, limit: int) -> list[str]:
+        grams = trigrams(text)
+        shared: Counter[int] = Counter()
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting:
+                shared.update(posting)
+        scored = []
+        for entry_id, count in shared.items():
+            similarity = 2 * count / (len(grams) + self.sizes[entry_id])
+            if similarity >= HINT_MIN_SIMILARITY and self.groups[entry_id] == group:
+                scored.append((similarity, entry_id))
+        return [self.keys[entry_id] for _, entry_id in heapq.nlargest(limit, scored)]
+
+
+def batch_hints(
+    kind: TranslationKind,
+    index: TrigramIndex,
+    translations: dict[str, str],
+    batch: list[Any],
+    limit: int,
+    components: dict[str, dict[str, str]] | None = None,
+) -> dict[str, str]:
+    if not limit:
+        return {}
+    for key in translations:
+        if key not in index.ids:
+            group, text = kind.split_key(key)
+            index.add(key, text, group)
+    hints: dict[str, str] = {}
+    for row in batch:
+        group, text = kind.split_key(kind.key(row))
+        for key in index.query(text, group, limit):
+            if key in translations:
+                hints[kind.split_key(key)[1]] = translations[key]
+        if components:
+            hints.update(components.get(kind.key(row), {}))
+    return hints
+
+
+class Composer:
+    def __init__(self, pairs: Iterable[tuple[str, str]]) -> None:
+        by_head: dict[str, list[tuple[str, str]]] = defaultdict(list)
+        for source_text, target_text in pairs:
+            words = source_text.split(" ")
+            if len(words) < 2 or LATIN_WORD_RE.search(target_text):
+                continue
+            for split in range(1, len(words)):
+                by_head[" ".join(words[split:])].append(
+                    (" ".join(words[:split]), target_text)
+                )
+
+        heads: dict[str, str] = {}
+        held_out_suffixes: dict[str, Counter[str]] = {}
+        observed: dict[str, Counter[str]] = defaultdict(Counter)
+        for head, entries in by_head.items():
+            if len(entries) < COMPOSE_MIN_SUPPORT:
+                continue
+            suffixes = Counter(
+                target[-length:]
+                for _, target in entries
+                for length in range(1, len(target))
+            )
+            needed = max(COMPOSE_MIN_SUPPORT, COMPOSE_HEAD_SHARE * len(entries))
+            shared = [suffix for suffix, count in suffixes.items() if count >= needed]
+            if not shared:
+                continue
+            heads[head] = max(shared, key=len)
+            held_out_needed = max(
+                COMPOSE_MIN_SUPPORT, COMPOSE_HEAD_SHARE * (len(entries) - 1)
+            )
+            held_out_suffixes[head] = Counter(
+                {
+                    suffix: count
+                    for suffix, count in suffixes.items()
+                    if count >= held_out_needed
+                }
+            )
+            for modifier, target in entries:
+                if target.endswith(heads[head]):
+                    observed[modifier][target[: -len(heads[head])]] += 1
+        modifiers = {
+            modifier: candidates.most_common(1)[0][0]
+            for modifier, candidates in observed.items()
+        }
+
+        head_checks: dict[str, list[int]] = defaultdict(lambda: [0, 0])
+        modifier_checks: dict[str, list[int]] = defaultdict(lambda: [0, 0])
+        for head, target_head in heads.items():
+            for modifier, target in by_head[head]:
+                if modifier not in modifiers:
+                    continue
+                candidates = observed[modifier].copy()
+                if target.endswith(target_head):
+                    candidates[target[: -len(target_head)]] -= 1
+                held_out_modifier = max(
+                    (candidate for candidate in candidates if candidates[candidate] > 0),
+                    key=candidates.__getitem__,
+                    default=None,
+                )
+                held_out_head = self.held_out_head(
+                    held_out_suffixes[head], len(by_head[head]) - 1, target
+                )
+                correct = int(
+                    held_out_modifier is not None
+                    and held_out_head is not None
+                    and held_out_modifier + held_out_head == target
+                )
+                for checks in (head_checks[head], modifier_checks[modifier]):
+                    checks[0] += correct
+                    checks[1] += 1
+        self.heads = {
+            head: (target, self.confidence(head_checks[head]))
+            for head, target in heads.items()
+        }
+        self.modifiers = {
+            modifier: (target, self.confidence(modifier_checks[modifier]))
+            for modifier, target in modifiers.items()
+        }
+
+    @staticmethod
+    def held_out_head(suffixes: Counter[str], support: int, target: str) -> str | None:
+        if support < COMPOSE_MIN_SUPPORT:
+            return None
+        needed = max(COMPOSE_MIN_SUPPORT, COMPOSE_HEAD_SHARE * support)
+        shared = [
+            suffix
+            for suffix, count in suffixes.items()
+            if count - (len(suffix) < len(target) and target.endswith(suffix)) >= needed
+        ]
+        return max(shared, key=len, default=None)
+
+    @staticmethod
+    def confidence(checks: list[int]) -> float:
+        return checks[0] / (checks[1] + 1)
+
+    def split(self, source_text: str) -> tuple[str, str, float] | None:
+        words = source_text.split(" ")
+        best: tuple[str, str, float] | None = None
+        for split in range(1, len(words)):
+            modifier = " ".join(words[:split])
+            head = " ".join(words[split:])
+            if modifier not in self.modifiers or head not in self.heads:
+                continue
+            confidence = min(self.modifiers[modifier][1], self.heads[head][1])
+            if best is None or confidence > best[2]:
+                best = (modifier, head, confidence)
+        return best
+
+    def translate(self, source_text: str) -> tuple[str, float] | None:
+        split = self.split(source_text)
+        if split is None:
+            return None
+        modifier, head, confidence = split
+        return self.modifiers[modifier][0] + self.heads[head][0], confidence
+
+    def components(self, source_text: str) -> dict[str, str]:
+        split = self.split(source_text)
+        if split is None:
+            return {}
+        modifier, head, _ = split
+        return {modifier: self.modifiers[modifier][0], head: self.heads[head][0]}
+
+
+def compose_rows(
+    kind: TranslationKind,
+    translations: TranslationCache,
+    pending: list[Any],
+    threshold: float,
+) -> tuple[list[Any], dict[str, str], dict[str, dict[str, str]]]:
+    composer = Composer(
+        (kind.split_key(key)[1], target_text)
+        for key, target_text in translations.items()
+        if "composed" not in translations.metadata.get(key, {}).get("flags", [])
+        and not kind.placeholder(key)
+    )
+    remaining: list[Any] = []
+    composed: dict[str, str] = {}
+    components: dict[str, dict[str, str]] = {}
+    for row in pending:
+        text = kind.text(row)
+        result = composer.translate(text)
+        if (
+            result is None
+            or result[1] < threshold
+            or escalation_reason(kind, text, result[0])
+        ):
+            remaining.append(row)
+            if result is not None:
+                components[kind.key(row)] = composer.components(text)
+        else:
+            composed[kind.key(row)] = result[0]
+    return remaining, composed, components
+
+
+def encode_payload(
+    kind: TranslationKind, batch: list[Any], hints: dict[str, str] | None = None
+) -> str:
+    return json.dumps(
+        kind.user_payload(batch, hints), ensure_ascii=False, separators=(",", ":")
+    )
+
+
+def estimate_usage(
+    kind: TranslationKind, batch: list[Any], hints: dict[str, str] | None = None
+) -> tuple[int, int]:
+    payload = encode_payload(kind, batch, hints).encode("utf-8")
+    system = kind.system_prompt.encode("utf-8")
+    payload_tokens = len(payload) // ESTIMATED_BYTES_PER_TOKEN + 1
+    return len(system) // ESTIMATED_BYTES_PER_TOKEN + payload_tokens, payload_tokens
+
+
+def request_translation(
+    kind: TranslationKind,
+    api_base: str,
+    api_key: str,
+    model: str,
+    batch: list[Any],
+    timeout: float,
+    on_row: Callable[[Any, str], None] | None = None,
+    compress: bool = False,
+    hints: dict[str, str] | None = None,
+) -> tuple[dict[str, str], tuple[int, int, int] | None]:
+    body: dict[str, Any] = {
+        "model": model,
+        "temperature": 0,
+        "thinking": {"type": "disabled"},
+        "messages": [
+            {"role": "system", "content": kind.system_prompt},
+            {"role": "user", "content": encode_payload(kind, batch, hints)},
+        ],
+        "response_format": {"type": "json_object"},
+    }
+    if on_row is not None:
+        body["stream"] = True
+        body["stream_options"] = {"include_usage": True}
+    data = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    if compress:
+        data = gzip.compress(data, mtime=0)
+        headers["Content-Encoding"] = "gzip"
+    request = urllib.request.Request(
+        f"{api_base.rstrip('/')}/chat/completions",
+        data=data,
+        headers=headers,
+        method="POST",
+    )
+    if on_row is not None:
+        rows_by_id = kind.payload_rows(batch)
+        expected_ids = set(rows_by_id)
+        rows = TranslationRowStream()
+        streamed: dict[int, str] = {}
+
+        def on_content(delta: str) -> None:
+            for row in rows.feed(delta):
+                item_id = validate_row(row, expected_ids, streamed, kind.response_field)
+                on_row(rows_by_id[item_id], streamed[item_id])
+
+        with PROFILER.phase("response wait (worker)"):
+            response = urllib.request.urlopen(request, timeout=timeout)
+        with response, PROFILER.phase("read (worker)"):
+            content, reported = read_event_stream(response, on_content)
+        with PROFILER.phase("validate (worker)"):
+            return validate_response(kind, extract_json_object(content), batch), reported
+
+    with PROFILER.phase("response wait (worker)"):
+        response = urllib.request.urlopen(request, timeout=timeout)
+    with response, PROFILER.phase("read (worker)"):
+        response_data = json.loads(response.read().decode("utf-8"))
+    try:
+        content = response_data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError) as error:
+        raise ValueError(f"unexpected API response: {response_data!r}") from error
+    if not isinstance(content, str):
+        raise ValueError("API response message content is not text")
+    with PROFILER.phase("validate (worker)"):
+        translated = validate_response(kind, extract_json_object(content), batch)
+    return translated, reported_usage(response_data)
+
+
+def error_class(error: Exception) -> str:
+    if isinstance(error, urllib.error.HTTPError):
+        if error.code == 429:
+            return "rate limit"
+        if error.code == 408 or error.code >= 500:
+            return "server"
+        if error.code in REJECTED_STATUSES:
+            return "rejected"
+        return "refused"
+    if isinstance(error, TimeoutError) or (
+        isinstance(error, urllib.error.URLError) and isinstance(error.reason, TimeoutError)
+    ):
+        return "timeout"
+    if isinstance(error, ValueError):
+        return "invalid response"
+    return "connection"
+
+
+def retry_delay(error: Exception, kind: str, attempt: int) -> float:
+    base, cap = RETRY_DELAYS[kind]
+    delay = min(cap, base * 2 ** (attempt - 1)) + random.random() * base
+    if isinstance(error, urllib.error.HTTPError) and kind == "rate limit":
+        try:
+            delay = max(delay, float(error.headers.get("Retry-After", 0)))
+        except ValueError:
+            pass
+    return delay
+
+
+def translate_with_retries(
+    args: argparse.Namespace,
+    pool: EndpointPool,
+    budget: RunBudget,
+    kind: TranslationKind,
+    model: str,
+    batch: list[Any],
+    estimate: tuple[int, int],
+    streamed_rows: SimpleQueue[tuple[str, str, Any, str]] | None = None,
+    hints: dict[str, str] | None = None,
+) -> tuple[dict[str, str], str]:
+    received: dict[str, str] = {}
+    endpoint_model = model
+
+    def record(row: Any, target: str) -> None:
+        received[kind.key(row)] = target
+        if streamed_rows is not None:
+            streamed_rows.put((model, endpoint_model, row, target))
+
+    pending_batch = batch
+    last_error: Exception | None = None
+    timeouts = 0
+    attempt = 0
+    pool.retry_budget.request()
+    while attempt < args.retries:
+        attempt += 1
+        if attempt > 1 and budget.exhausted():
+            raise RuntimeError(f"batch abandoned at the {budget.stop_reason}: {last_error}")
+        with PROFILER.phase("endpoint wait (worker)"):
+            endpoint = pool.acquire(budget.deadline)
+        if endpoint is None:
+            if pool.refused:
+                raise RuntimeError(f"every endpoint refused the request: {last_error}")
+            budget.exhausted()
+            raise RuntimeError("batch abandoned at the deadline waiting for an endpoint")
+        endpoint_model = endpoint.model if endpoint.model and model == args.model else model
+        tokens = sum(estimate) * len(pending_batch) // len(batch)
+        timeout = endpoint.latency.timeout(tokens, args.timeout) * 2**timeouts
+        timeout = min(args.timeout, timeout)
+        remaining = budget.remaining_time()
+        if remaining is not None:
+            timeout = min(timeout, max(remaining, 1.0))
+        healthy = True
+        attempt_details: dict[str, Any] = {
+            "attempt": attempt,
+            "endpoint": endpoint.label,
+            "model": endpoint_model,
+            "rows": len(pending_batch),
+            "timeout": round(timeout, 1),
+        }
+        started = time.monotonic()
+        try:
+            with PROFILER.phase("request (worker)", attempt_details):
+                translated, usage = request_translation(
+                    kind,
+                    endpoint.api_base,
+                    endpoint.api_key,
+                    endpoint_model,
+                    pending_batch,
+                    timeout,
+                    None if streamed_rows is None else record,
+                    args.gzip_requests,
+                    hints,
+                )
+        except (
+            urllib.error.URLError,
+            TimeoutError,
+            ConnectionError,
+            http.client.HTTPException,
+        ) as error:
+            healthy = False
+            last_error = error
+            attempt_details["error"] = str(error)
+        except (ValueError, json.JSONDecodeError) as error:
+            endpoint.latency.observe(tokens, time.monotonic() - started)
+            budget.charge((*estimate, 0))
+            last_error = error
+            attempt_details["error"] = str(error)
+        else:
+            endpoint.latency.observe(tokens, time.monotonic() - started)
+            budget.charge(usage or (*estimate, 0))
+            pool.release(endpoint, healthy=True)
+            return {**received, **translated}, endpoint_model
+        failure = error_class(last_error)
+        pool.release(endpoint, healthy=healthy or failure in POISON_FAILURES)
+        if received:
+            pending_batch = [row for row in batch if kind.key(row) not in received]
+            if not pending_batch:
+                return received, endpoint_model
+        if failure == "rejected":
+            raise BatchFailed(f"batch rejected by {endpoint.label}: {last_error}", failure)
+        if failure == "refused":
+            pool.refuse(endpoint, last_error)
+            attempt -= 1
+            continue
+        if attempt == args.retries:
+            break
+        if not pool.retry_budget.try_retry():
+            message = f"batch abandoned with the retry budget spent: {last_error}"
+            if failure in POISON_FAILURES:
+                raise BatchFailed(message, failure)
+            raise RuntimeError(message)
+        if failure == "timeout":
+            timeouts += 1
+        if not healthy and failure != "rate limit" and pool.has_alternative(endpoint):
+            delay = 0.0
+        else:
+            delay = retry_delay(last_error, failure, attempt)
+        remaining = budget.remaining_time()
+        if remaining is not None:
+            delay = max(0.0, min(delay, remaining))
+        print(
+            f"Batch failed on {endpoint.label} ({attempt}/{args.retries}, {failure}): "
+            f"{last_error}; retrying in {delay:.1f}s",
+            file=sys.stderr,
+        )
+        with PROFILER.phase("retry backoff (worker)", {"attempt": attempt, "delay": delay}):
+            time.sleep(delay)
+    raise BatchFailed(f"batch failed after {args.retries} attempts: {last_error}", failure)
+
+
+def escalation_reason(
+    kind: TranslationKind, source_text: str, target_text: str
+) -> str | None:
+    if kind.placeholder(source_text):
+        return None
+    if target_text == source_text:
+        return "unchanged"
+    if LATIN_WORD_RE.search(target_text):
+        return "Latin letters remain"
+    low, high = LENGTH_RATIO_RANGE
+    if source_text and not low <= len(target_text) / len(source_text) <= high:
+        return "length ratio out of range"
+    return None
+
+
+def make_batches(
+    kind: TranslationKind, pending: list[Any], batch_size: int
+) -> Iterator[list[Any]]:
+    for offset in range(0, len(pending), batch_size):
+        yield sorted(
+            pending[offset : offset + batch_size],
+            key=lambda row: kind.split_key(kind.key(row))[0],
+        )
+
+
+def print_estimate(
+    args: argparse.Namespace, kind: TranslationKind, batches: list[list[Any]]
+) -> None:
+    texts = sum(len(batch) for batch in batches)
+    print(f"Pending {kind.counted} after the cache: {texts} in {len(batches)} batches")
+    if not batches:
+        return
+    estimates = [estimate_usage(kind, batch) for batch in batches]
+    prompt_tokens = sum(estimate[0] for estimate in estimates)
+    completion_tokens = sum(estimate[1] for estimate in estimates)
+    cached_tokens = 0
+    runs = [
+        entry
+        for entry in load_history(history_path(args.cache))
+        if entry.get("batches") and entry.get("texts") and entry.get("prompt_tokens")
+    ]
+    runs = [entry for entry in runs if entry.get("model") == args.model] or runs
+
+    def total(name: str) -> float:
+        return sum(entry.get(name) or 0 for entry in runs)
+
+    if runs:
+        if total("estimated_prompt_tokens"):
+            prompt_tokens = round(
+                prompt_tokens * total("prompt_tokens") / total("estimated_prompt_tokens")
+            )
+        completion_tokens = round(texts * total("completion_tokens") / total("texts"))
+        cached_share = total("cached_tokens") / total("prompt_tokens")
+        cached_tokens = round(prompt_tokens * cached_share)
+        basis = f"calibrated on the run history ({len(runs)} runs)"
+    else:
+        basis = "from payload sizes; no run history yet"
+    print(
+        f"Estimated {prompt_tokens} prompt tokens ({cached_tokens} cached) and "
+        f"{completion_tokens} completion tokens, {basis}"
+    )
+    if args.input_price or args.output_price:
+        cost = RunBudget(
+            None, None, None, args.input_price, args.output_price, args.cached_input_price
+        )
+        cost.charge((prompt_tokens, completion_tokens, cached_tokens))
+        print(f"Estimated cost {cost.cost:.4f} at the given prices")
+    if runs:
+        concurrency = sum(endpoint.concurrency for endpoint in args.endpoints)
+        batch_seconds = total("batch_seconds") / total("batches")
+        waves = -(-len(batches) // concurrency)
+        print(
+            f"Estimated wall-clock time {waves * batch_seconds:.1f}s at concurrency "
+            f"{concurrency} ({batch_seconds:.1f}s per batch)"
+        )
+
+
+def estimate_run(
+    args: argparse.Namespace,
+    kind: TranslationKind,
+    pending_rows: Callable[[Container[str]], list[Any]],
+) -> int:
+    with PROFILER.phase("load_cache"):
+        archived = load_archive(archive_path(args.cache))
+        cached = read_cache(args.cache, kind)
+        quarantine = load_quarantine(quarantine_path(args.cache))
+        known = cached.keys() | archived.keys() | quarantine.keys()
+    pending = pending_rows(known)
+    if args.compose:
+        pending, composed, _ = compose_rows(kind, cached, pending, args.compose_threshold)
+        print(f"{len(composed)} pending {kind.noun} can be composed locally")
+    print_estimate(args, kind, list(make_batches(kind, pending, args.batch_size)))
+    print("Dry run complete; no API request or output file was created.")
+    return 0
+
+
+def translate_batches(
+    args: argparse.Namespace,
+    kind: TranslationKind,
+    pool: EndpointPool,
+    budget: RunBudget,
+    translations: TranslationCache,
+    quarantine: dict[str, dict[str, Any]],
+    pending: list[Any],
+    total_keys: int,
+    components: dict[str, dict[str, str]],
+) -> list[tuple[int, float, tuple[int, int]]]:
+    source_batches = enumerate(make_batches(kind, pending, args.batch_size), start=1)
+    total_batches = -(-len(pending) // args.batch_size)
+    models = list(dict.fromkeys([args.model, *args.escalate_model]))
+    if pending:
+        print(
+            f"Translating {len(pending)} {kind.counted} in {total_batches} batches "
+            f"with concurrency {min(pool.capacity, total_batches)}...",
+            flush=True,
+        )
+    hint_index = TrigramIndex()
+    finished: list[tuple[int, float, tuple[int, int]]] = []
+    fatal: RuntimeError | None = None
+    bisected: set[int] = set()
+    bisected_passed = 0
+    quarantined: dict[str, dict[str, Any] | None] = {}
+    quarantine_limit = max(QUARANTINE_PROBE_ROWS, int(QUARANTINE_MAX_SHARE * len(pending)))
+    with PROFILER.phase("executor loop"), CacheWriter(
+        args.cache, translations
+    ) as cache_writer, ThreadPoolExecutor(
+        max_workers=pool.capacity, thread_name_prefix="request"
+    ) as executor:
+        sources_left = total_batches
+        queued: deque[tuple[int, Any, int]] = deque()
+        futures = {}
+        streamed_rows: SimpleQueue[tuple[str, str, Any, str]] = SimpleQueue()
+        escalation_queues: list[list[Any]] = [[] for _ in models]
+        while True:
+            while fatal is None and len(futures) < pool.capacity:
+                if not queued:
+                    if not sources_left:
+                        break
+                    sources_left -= 1
+                    queued.append((*next(source_batches), 0))
+                batch_number, batch, tier = queued[0]
+                with PROFILER.phase("form batch", {"batch": batch_number, "tier": tier}):
+                    hints = batch_hints(
+                        kind, hint_index, translations, batch, args.hints, components
+                    )
+                    estimate = estimate_usage(kind, batch, hints)
+                if not budget.reserve(estimate):
+                    break
+                queued.popleft()
+                future = executor.submit(
+                    translate_with_retries,
+                    args,
+                    pool,
+                    budget,
+                    kind,
+                    models[tier],
+                    batch,
+                    estimate,
+                    streamed_rows if args.stream else None,
+                    hints,
+                )
+                futures[future] = (
+                    batch_number, batch, tier, estimate, time.perf_counter()
+                )
+            if not futures:
+                break
+            with PROFILER.phase("executor wait"):
+                done, _ = wait(
+                    futures,
+                    timeout=STREAM_COMMIT_INTERVAL if args.stream else None,
+                    return_when=FIRST_COMPLETED,
+                )
+            streamed = 0
+            with PROFILER.phase("record rows"), cache_writer.lock:
+                while not streamed_rows.empty():
+                    tier_model, row_model, row, target_text = streamed_rows.get()
+                    reason = escalation_reason(kind, kind.text(row), target_text)
+                    if tier_model == models[-1] or not reason:
+                        flags = [reason] if reason else []
+                        translations.record(kind.key(row), target_text, row_model, flags)
+                        streamed += 1
+            if streamed:
+                cache_writer.commit()
+            for future in done:
+                batch_number, batch, tier, estimate, submitted_at = futures.pop(future)
+                budget.release(estimate)
+                finished.append((len(batch), time.perf_counter() - submitted_at, estimate))
+                PROFILER.trace_span(
+                    f"batch {batch_number}",
+                    batch_number,
+                    submitted_at,
+                    {"tier": tier, "model": models[tier], "rows": len(batch)},
+                )
+                final_tier = tier == len(models) - 1
+                served_model = models[tier]
+                try:
+                    translated, served_model = future.result()
+                except RuntimeError as error:
+                    poisoned = (
+                        isinstance(error, BatchFailed)
+                        and error.failure in POISON_FAILURES
+                        and budget.stop_reason is None
+                    )
+                    if final_tier and budget.stop_reason is None and not poisoned:
+                        if fatal is None:
+                            fatal = error
+                            print(
+                                f"Batch {batch_number} failed on {models[tier]}: {error}; "
+                                "waiting for the batches in flight before stopping",
+                                file=sys.stderr,
+                                flush=True,
+                            )
+                        continue
+                    print(
+                        f"Batch {batch_number} failed on {models[tier]}: {error}",
+                        file=sys.stderr,
+                    )
+                    batch = [row for row in batch if kind.key(row) not in translations]
+                    if not final_tier or not poisoned or not batch:
+                        translated = {}
+                    elif fatal is not None:
+                        continue
+                    elif len(batch) > 1:
+                        middle = len(batch) // 2
+                        total_batches += 2
+                        queued.extendleft(
+                            [
+                                (total_batches, batch[middle:], tier),
+                                (total_batches - 1, batch[:middle], tier),
+                            ]
+                        )
+                        bisected.update((total_batches - 1, total_batches))
+                        print(
+                            f"Bisecting batch {batch_number} into batches "
+                            f"{total_batches - 1} and {total_batches}",
+                            flush=True,
+                        )
+                        continue
+                    else:
+                        key = kind.key(batch[0])
+                        quarantined.setdefault(key, quarantine.get(key))
+                        add_to_quarantine(quarantine, key, models[tier], error)
+                        save_quarantine(quarantine_path(args.cache), quarantine)
+                        print(
+                            f"Quarantined {kind.text(batch[0])!r} in "
+                            f"{quarantine_path(args.cache)}",
+                            flush=True,
+                        )
+                        probes_failed = len(quarantined) >= QUARANTINE_PROBE_ROWS
+                        if len(quarantined) <= quarantine_limit and (
+                            bisected_passed or not probes_failed
+                        ):
+                            continue
+                        for key, entry in quarantined.items():
+                            if entry is None:
+                                del quarantine[key]
+                            else:
+                                quarantine[key] = entry
+                        save_quarantine(quarantine_path(args.cache), quarantine)
+                        fatal = RuntimeError(
+                            f"{models[tier]} rejected {len(quarantined)} {kind.noun} one "
+                            "at a time"
+                            + (
+                                f", more than {QUARANTINE_MAX_SHARE:.0%} of the run"
+                                if bisected_passed
+                                else " and no bisected batch got through"
+                            )
+                            + f"; it is refusing the requests, not the content: {error}"
+                        )
+                        print(
+                            f"Took {len(quarantined)} {kind.noun} back out of "
+                            f"{quarantine_path(args.cache)}; waiting for the batches in "
+                            "flight before stopping",
+                            file=sys.stderr,
+                            flush=True,
+                        )
+                        continue
+                else:
+                    if batch_number in bisected:
+                        bisected_passed += 1
+
+                escalated: list[Any] = []
+                with PROFILER.phase("record rows"), cache_writer.lock:
+                    for row in batch:
+                        key = kind.key(row)
+                        target_text = translated.get(key)
+                        reason = None
+                        if target_text is not None:
+                            reason = escalation_reason(kind, kind.text(row), target_text)
+                        if target_text is None or (not final_tier and reason):
+                            escalated.append(row)
+                        else:
+                            flags = [reason] if reason else []
+                            translations.record(key, target_text, served_model, flags)
+                if escalated and budget.stop_reason is None:
+                    escalation_queues[tier + 1].extend(escalated)
+                    print(
+                        f"Escalating {len(escalated)} {kind.noun} from batch "
+                        f"{batch_number} to {models[tier + 1]}",
+                        flush=True,
+                    )
+                cache_writer.commit()
+                print(
+                    f"Completed batch {batch_number}/{total_batches}; "
+                    f"cached {len(translations)}/{total_keys} {kind.counted}",
+                    flush=True,
+                )
+
+            for next_tier in range(1, len(models)):
+                queue = escalation_queues[next_tier]
+                lower_tier_busy = sources_left > 0 or any(
+                    scheduled[2] < next_tier
+                    for scheduled in (*futures.values(), *queued)
+                )
+                while len(queue) >= args.batch_size or (queue and not lower_tier_busy):
+                    batch = queue[: args.batch_size]
+                    del queue[: args.batch_size]
+                    total_batches += 1
+                    queued.append((total_batches, batch, next_tier))
+    if fatal is not None:
+        raise fatal
+    return finished
+
+
+def translate_missing(
+    args: argparse.Namespace,
+    kind: TranslationKind,
+    keys: list[str],
+    pending_rows: Callable[[Container[str]], list[Any]],
+) -> tuple[TranslationCache, int | None]:
+    for endpoint in args.endpoints:
+        endpoint.api_key = os.environ.get(endpoint.api_key_env, "")
+        if not endpoint.api_key:
+            raise ValueError(f"environment variable {endpoint.api_key_env} is not set")
+    pool = EndpointPool(args.endpoints, args.retry_budget)
+    budget = RunBudget(
+        args.deadline,
+        args.max_tokens,
+        args.max_cost,
+        args.input_price,
+        args.output_price,
+        args.cached_input_price,
+    )
+
+    with PROFILER.phase("load_cache"):
+        translations = read_cache(args.cache, kind)
+        quarantine = load_quarantine(quarantine_path(args.cache))
+    if args.retry_unchanged:
+        unchanged = []
+        for key, target_text in translations.items():
+            text = kind.split_key(key)[1]
+            if text == target_text and not kind.placeholder(text):
+                unchanged.append(key)
+        for key in unchanged:
+            del translations[key]
+        if unchanged:
+            save_cache(args.cache, translations)
+            print(f"Discarded {len(unchanged)} unchanged cached translations.")
+    if not args.no_gc:
+        with PROFILER.phase("gc"):
+            archived, evicted = collect_garbage(
+                args.cache,
+                translations,
+                set(keys),
+                args.archive_max_age_days,
+                args.archive_max_entries,
+            )
+        if archived:
+            print(
+                f"Archived {archived} cached translations no longer used by "
+                f"{args.input} to {archive_path(args.cache)}"
+                + (f"; evicted {evicted} old archive entries" if evicted else "")
+            )
+    with PROFILER.phase("restore_archived"):
+        restored = restore_archived(
+            args.cache, translations, [key for key in keys if key not in translations]
+        )
+    if restored:
+        print(f"Restored {restored} translations from {archive_path(args.cache)}")
+
+    with PROFILER.phase("batching"):
+        if args.retry_quarantine:
+            known = {key for key in keys if key not in quarantine}
+        else:
+            known = quarantine.keys()
+        pending = pending_rows(translations.keys() | known)
+    components: dict[str, dict[str, str]] = {}
+    if args.compose:
+        with PROFILER.phase("compose"):
+            pending, composed, components = compose_rows(
+                kind, translations, pending, args.compose_threshold
+            )
+        for key, target_text in composed.items():
+            translations.record(key, target_text, None, ["composed"])
+        if composed:
+            save_cache(args.cache, translations)
+            print(
+                f"Composed {len(composed)} {kind.noun} locally from cached modifier and "
+                "head translations"
+            )
+    loop_started = time.monotonic()
+    finished = translate_batches(
+        args, kind, pool, budget, translations, quarantine, pending, len(keys), components
+    )
+    record_run(args, pool, budget, finished, time.monotonic() - loop_started)
+    if len(pool.endpoints) > 1:
+        print(
+            "Endpoint usage: "
+            + ", ".join(
+                f"{endpoint.label} {endpoint.completed}" for endpoint in pool.endpoints
+            )
+        )
+
+    if budget.limited or args.input_price or args.output_price:
+        print(
+            f"Used {budget.prompt_tokens + budget.completion_tokens} tokens "
+            f"({budget.prompt_tokens} prompt, {budget.cached_tokens} of them cached, "
+            f"{budget.completion_tokens} completion)"
+            + (
+                f", about {budget.cost:.4f} at the given prices"
+                if args.input_price or args.output_price
+                else ""
+            )
+        )
+
+    live_keys = set(keys)
+    resolved = [key for key in quarantine if key in translations or key not in live_keys]
+    for key in resolved:
+        del quarantine[key]
+    if resolved:
+        save_quarantine(quarantine_path(args.cache), quarantine)
+    missing_keys = [key for key in keys if key not in translations]
+    if not missing_keys:
+        return translations, None
+    if budget.stop_reason is not None:
+        print(f"Reached the {budget.stop_reason}; stopped submitting batches.")
+    quarantined = sum(key in quarantine for key in missing_keys)
+    if quarantined < len(missing_keys):
+        print(
+            f"Stopped with {len(missing_keys) - quarantined} untranslated "
+            f"{kind.counted}. Run again without {kind.limit_flag} or budget limits to "
+            "finish; the cache has been saved."
+        )
+    if quarantined:
+        print(
+            f"{quarantined} {kind.noun} failed on every model and are quarantined in "
+            f"{quarantine_path(args.cache)}; fix the cause and run again with "
+            "--retry-quarantine."
+        )
+        return translations, 1
+    return translations, 0
+
+
+def run_profiled(run: Callable[[argparse.Namespace], int], args: argparse.Namespace) -> int:
+    if not args.profile:
+        return run(args)
+    PROFILER.start(args.profile_memory, args.trace_out is not None)
+    stats_profile = cProfile.Profile() if args.profile_stats else None
+    try:
+        if stats_profile is None:
+            return run(args)
+        return stats_profile.runcall(run, args)
+    finally:
+        if stats_profile is not None:
+            stats_profile.dump_stats(args.profile_stats)
+        if args.trace_out is not None:
+            atomic_write_text(args.trace_out, PROFILER.chrome_trace())
+        print(PROFILER.report(), file=sys.stderr)
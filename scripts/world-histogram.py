@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""Count the tiles, frames, walls and chest items that occur in Terraria .wld files."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import struct
+import sys
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO
+
+from translate_common import atomic_write_text
+
+
+@dataclass
+class Histogram:
+    worlds: list[str] = field(default_factory=list)
+    tiles: Counter[int] = field(default_factory=Counter)
+    frames: Counter[tuple[int, int, int]] = field(default_factory=Counter)
+    walls: Counter[int] = field(default_factory=Counter)
+    items: Counter[int] = field(default_factory=Counter)
+
+    def to_json(self) -> dict[str, object]:
+        return {
+            "version": 1,
+            "worlds": self.worlds,
+            "tiles": {str(tile_id): count for tile_id, count in sorted(self.tiles.items())},
+            "frames": {
+                f"{tile_id},{u},{v}": count
+                for (tile_id, u, v), count in sorted(self.frames.items())
+            },
+            "walls": {str(wall_id): count for wall_id, count in sorted(self.walls.items())},
+            "items": {str(item_id): count for item_id, count in sorted(self.items.items())},
+        }
+
+
+class WorldReader:
+    def __init__(self, handle: BinaryIO) -> None:
+        self.handle = handle
+
+    def read(self, size: int) -> bytes:
+        data = self.handle.read(size)
+        if len(data) != size:
+            raise ValueError("unexpected end of world file")
+        return data
+
+    def u8(self) -> int:
+        return self.read(1)[0]
+
+    def i16(self) -> int:
+        return struct.unpack("<h", self.read(2))[0]
+
+    def u16(self) -> int:
+        return struct.unpack("<H", self.read(2))[0]
+
+    def i32(self) -> int:
+        return struct.unpack("<i", self.read(4))[0]
+
+    def string(self) -> str:
+        length = 0
+        shift = 0
+        while True:
+            part = self.u8()
+            length |= (part & 0x7F) << shift
+            shift += 7
+            if not part & 0x80:
+                break
+        return self.read(length).decode("utf-8", errors="replace")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Stream the tile, wall and chest sections of .wld files and count "
+        "which tile IDs, frames, walls and items they use."
+    )
+    parser.add_argument(
+        "worlds",
+        nargs="*",
+        type=Path,
+        help="world files to scan (default: Worlds/*.wld)",
+    )
+    parser.add_argument(
+        "--output", type=Path, default=Path(".cache/world-histogram.json")
+    )
+    args = parser.parse_args()
+    args.worlds = args.worlds or sorted(Path("Worlds").glob("*.wld"))
+    if not args.worlds:
+        parser.error("no world files given and none found under Worlds/")
+    return args
+
+
+def read_world(path: Path, histogram: Histogram) -> None:
+    with path.open("rb") as handle:
+        reader = WorldReader(handle)
+        version = reader.i32()
+        if reader.read(7) != b"relogic":
+            raise ValueError(f"{path} is not a Terraria world file")
+        reader.read(1 + 4 + 8)
+        positions = [reader.i32() for _ in range(reader.i16())]
+        importance_count = reader.i16()
+        importance_bytes = reader.read((importance_count + 7) // 8)
+        important = [
+            bool(importance_bytes[index // 8] >> (index % 8) & 1)
+            for index in range(importance_count)
+        ]
+
+        handle.seek(positions[0])
+        reader.string()
+        reader.string()
+        reader.read(8 + 16 + 4 + 16)
+        height = reader.i32()
+        width = reader.i32()
+
+        handle.seek(positions[1])
+        read_tiles(reader, width, height, important, histogram)
+        handle.seek(positions[2])
+        read_chests(reader, version, histogram)
+    histogram.worlds.append(path.name)
+
+
+def read_tiles(
+    reader: WorldReader,
+    width: int,
+    height: int,
+    important: list[bool],
+    histogram: Histogram,
+) -> None:
+    for _ in range(width):
+        y = 0
+        while y < height:
+            header = reader.u8()
+            flags2 = reader.u8() if header & 1 else 0
+            flags3 = reader.u8() if flags2 & 1 else 0
+            if flags3 & 1:
+                reader.u8()
+
+            tile_id = -1
+            u = v = -1
+            if header & 2:
+                tile_id = reader.u16() if header & 32 else reader.u8()
+                if tile_id < len(important) and important[tile_id]:
+                    u = reader.i16()
+                    v = reader.i16()
+                    if tile_id == 144:
+                        v = 0
+                if flags3 & 8:
+                    reader.u8()
+
+            wall_id = 0
+            if header & 4:
+                wall_id = reader.u8()
+                if flags3 & 16:
+                    reader.u8()
+            if header & 24:
+                reader.u8()
+            if flags3 & 64:
+                wall_id |= reader.u8() << 8
+
+            run_kind = (header & 0xC0) >> 6
+            repeat = 0 if run_kind == 0 else reader.u8() if run_kind == 1 else reader.i16()
+            count = repeat + 1
+            if tile_id >= 0:
+                histogram.tiles[tile_id] += count
+                if u >= 0:
+                    histogram.frames[tile_id, u, v] += count
+            if wall_id:
+                histogram.walls[wall_id] += count
+            y += count
+
+
+def read_chests(reader: WorldReader, version: int, histogram: Histogram) -> None:
+    chest_count = reader.i16()
+    slots = reader.i16() if version < 294 else 0
+    for _ in range(chest_count):
+        reader.read(8)
+        reader.string()
+        max_items = 40
+        if version >= 294:
+            max_items = slots = reader.i32()
+        for slot in range(slots):
+            stack = reader.i16()
+            if stack == 0:
+                continue
+            item_id = reader.i32()
+            reader.u8()
+            if slot < max_items:
+                histogram.items[item_id] += 1
+
+
+def main() -> int:
+    args = parse_args()
+    histogram = Histogram()
+    for path in args.worlds:
+        read_world(path, histogram)
+        print(f"Scanned {path}")
+    atomic_write_text(args.output, json.dumps(histogram.to_json(), indent=2) + "\n")
+    print(
+        f"Wrote {len(histogram.tiles)} tile IDs, {len(histogram.frames)} frames, "
+        f"{len(histogram.walls)} wall IDs and {len(histogram.items)} item IDs "
+        f"to {args.output}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        raise SystemExit(1)